@@ -1,116 +1,459 @@
-
-
 import os
 import time
 import asyncio
 import requests
 import subprocess
 import logging
-import glob
+import shlex
+import shutil
+import threading
+from dataclasses import dataclass, field, fields, replace
 from gradio_client import Client
+import metrics
+import media_jobs
 from config import *
 
 logger = logging.getLogger(__name__)
 
-async def is_ace_alive():
-    try:
-        # Используем to_thread, чтобы сетевой запрос не вешал весь скрипт
-        resp = await asyncio.to_thread(requests.get, f"{ACE_API_URL}/", timeout=2)
-        return resp.status_code == 200
-    except:
-        return False
+@dataclass
+class GenerationParams:
+    """
+    Аргументы /generation_wrapper по именам. Порядок полей = порядок позиционных аргументов
+    эндпоинта, поэтому менять параметры можно через replace(), не трогая кортеж.
+    """
+    caption: str
+    lyrics: str
+    bpm: int
+    key_scale: str
+    time_signature: str = ""
+    vocal_language: str = "unknown"
+    inference_steps: int = 8
+    guidance_scale: float = 7.0
+    random_seed: bool = True
+    seed: str = "-1"
+    reference_audio: object = None
+    audio_duration: int = TRACK_DURATION
+    batch_size: int = 1
+    src_audio: object = None
+    audio_codes: str = ""
+    repainting_start: float = 0.0
+    repainting_end: float = -1.0
+    instruction: str = "Fill the audio semantic mask..."
+    audio_cover_strength: float = 1.0
+    task_type: str = "text2music"
+    use_adg: bool = False
+    cfg_interval_start: float = 0.0
+    cfg_interval_end: float = 1.0
+    shift: float = 3.0
+    infer_method: str = "ode"
+    custom_timesteps: str = ""
+    audio_format: str = "flac"
+    lm_temperature: float = 0.85
+    think: bool = True
+    lm_cfg_scale: float = 2.0
+    lm_top_k: int = 0
+    lm_top_p: float = 0.9
+    lm_negative_prompt: str = "NO USER INPUT"
+    use_cot_metas: bool = True
+    use_cot_caption: bool = True
+    use_cot_language: bool = True
+    constrained_decoding_debug: bool = False
+    allow_lm_batch: bool = True
+    auto_score: bool = False
+    auto_lrc: bool = False
+    score_scale: float = 0.5
+    lm_batch_chunk_size: int = 8
+    track_name: str = "vocals"
+    complete_track_classes: list = field(default_factory=list)
+    is_format_caption: bool = False
 
-async def stop_ace_server():
-    print("🛑 Остановка старых процессов ACE...")
-    if os.path.exists("ace_server.pid"):
+    def to_args(self):
+        return tuple(getattr(self, f.name) for f in fields(self))
+
+class AceClient:
+    """
+    Долгоживущий клиент Gradio для ACE: схема API запрашивается один раз при первом обращении,
+    HTTP-соединения переиспользуются. После перезапуска сервера — reset(), и следующий вызов
+    подключится заново.
+    """
+
+    def __init__(self, url=ACE_API_URL):
+        self.url = url
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                # download_files=False: получаем путь к файлу на сервере (он на этой же машине)
+                # вместо копии во временной папке клиента
+                self._client = Client(self.url, download_files=False)
+            return self._client
+
+    def reset(self):
+        with self._lock:
+            old, self._client = self._client, None
+        if old is not None:
+            close = getattr(old, "close", None)
+            try:
+                if close: close()
+            except Exception: pass
+
+    def predict(self, *args, api_name):
+        return self.client.predict(*args, api_name=api_name)
+
+    def generate(self, params):
+        return self.predict(*params.to_args(), api_name="/generation_wrapper")
+
+class AceInstance:
+    """
+    Один процесс ACE (acestep через ace_wrapper.py) на своем порту, со своим PID-файлом,
+    своими логами и, при желании, своим набором ядер. Экземпляр 0 живет на ACE_API_URL
+    и пишет в старые ace_server.pid / ace_stderr.log.
+    """
+
+    def __init__(self, index, url, cpus=None):
+        self.index = index
+        self.url = url
+        self.port = int(url.rstrip("/").rsplit(":", 1)[1])
+        self.cpus = cpus
+        self.name = f"ACE#{index}"
+        self.pid_file = "ace_server.pid" if index == 0 else f"ace_server_{index}.pid"
+        self.log_prefix = "ace" if index == 0 else f"ace_{index}"
+        # Свой кэш Gradio у каждого экземпляра: janitor чистит его, не трогая чужие файлы
+        self.cache_dir = os.path.abspath(os.path.join(ACE_CACHE_DIR, f"instance_{index}"))
+        self.client = AceClient(url)
+        self.proc = None
+
+    async def is_alive(self):
         try:
-            with open("ace_server.pid") as f: pid = int(f.read().strip())
-            os.kill(pid, 15)
-            await asyncio.sleep(2)
-            os.kill(pid, 9)
-        except: pass
-        finally:
-            if os.path.exists("ace_server.pid"): os.remove("ace_server.pid")
-    subprocess.run(["pkill", "-f", "acestep"], stderr=subprocess.DEVNULL)
-    subprocess.run(["pkill", "-f", "ace_wrapper.py"], stderr=subprocess.DEVNULL)
+            # Используем to_thread, чтобы сетевой запрос не вешал весь скрипт
+            resp = await asyncio.to_thread(requests.get, f"{self.url}/", timeout=2)
+            return resp.status_code == 200
+        except:
+            return False
 
-async def start_ace_server_process():
-    print("🚀 Запускаю ace_wrapper.py...")
-    try:
-        # shell=True нужен, чтобы подхватить алиасы и пути
-        subprocess.Popen(f"python3 ace_wrapper.py --device cpu", shell=True)
-        print("⏳ Процесс запущен. Ждем 60 секунд на загрузку весов модели...")
-        # Модель тяжелая, ей нужно время просто чтобы "встать"
-        for i in range(1, 7):
-            await asyncio.sleep(10)
-            print(f"   ...загрузка идет уже {i*10} сек...")
-    except Exception as e:
-        print(f"❌ Ошибка при попытке запустить процесс: {e}")
+    async def stop(self):
+        print(f"🛑 [{self.name}] Остановка процессов ACE...")
+        if os.path.exists(self.pid_file):
+            try:
+                with open(self.pid_file) as f: pid = int(f.read().strip())
+                os.kill(pid, 15)
+                await asyncio.sleep(2)
+                os.kill(pid, 9)
+            except: pass
+            finally:
+                if os.path.exists(self.pid_file): os.remove(self.pid_file)
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+        self.proc = None
+        if ACE_INSTANCES == 1:
+            # Один сервер — можно добить все, в том числе запущенное руками
+            subprocess.run(["pkill", "-f", "acestep"], stderr=subprocess.DEVNULL)
+            subprocess.run(["pkill", "-f", "ace_wrapper.py"], stderr=subprocess.DEVNULL)
+        else:
+            # В пуле трогаем только свой порт, соседи продолжают генерацию
+            subprocess.run(["pkill", "-f", f"acestep.*--port {self.port}"], stderr=subprocess.DEVNULL)
+        # Старые соединения и схема API принадлежали убитому процессу
+        self.client.reset()
 
-async def initialize_ace_model():
-    print("⚙️  Инициализация модели в Gradio...")
-    try:
-        client = Client(ACE_API_URL)
-        checkpoint_response = client.predict(api_name="/lambda")
-        path = checkpoint_response['choices'][0] if isinstance(checkpoint_response, dict) else checkpoint_response
-        client.predict(path, MODEL_CONFIG, "cpu", False, LM_MODEL, "vllm", False, True, True, True, True, api_name="/lambda_1")
-        print("✨ Модель успешно инициализирована!")
-        return True
-    except Exception as e:
-        print(f"❌ Ошибка инициализации: {e}")
+    async def start_process(self):
+        print(f"🚀 [{self.name}] Запускаю ace_wrapper.py на порту {self.port}...")
+        cmd = ["python3", "ace_wrapper.py", "--device", "cpu", "--port", str(self.port),
+               "--pid-file", self.pid_file, "--log-prefix", self.log_prefix]
+        if self.cpus:
+            cmd += ["--cpus", ",".join(str(c) for c in self.cpus)]
+        # Потоков torch/OpenMP не больше, чем ядер у экземпляра: иначе они толкаются на чужих ядрах
+        threads = ACE_THREADS or (len(self.cpus) if self.cpus else 0)
+        if threads:
+            cmd += ["--threads", str(threads)]
+        # Старые логи убираем, чтобы не принять прошлую метку готовности за новую
+        for path in self.log_files():
+            if os.path.exists(path): os.remove(path)
+        try:
+            # shell=True нужен, чтобы подхватить алиасы и пути
+            os.makedirs(self.cache_dir, exist_ok=True)
+            env = dict(os.environ, GRADIO_TEMP_DIR=self.cache_dir)
+            self.proc = subprocess.Popen(shlex.join(cmd), shell=True, env=env)
+            print(f"⏳ [{self.name}] Процесс запущен, жду готовности (не дольше {ACE_STARTUP_TIMEOUT} сек)...")
+            return True
+        except Exception as e:
+            print(f"❌ [{self.name}] Ошибка при попытке запустить процесс: {e}")
+            return False
+
+    def log_files(self):
+        return [f"{self.log_prefix}_stdout.log", f"{self.log_prefix}_stderr.log"]
+
+    def _log_has_ready_marker(self, offsets):
+        # Дочитываем только новые байты логов с прошлой проверки
+        for path in self.log_files():
+            try:
+                with open(path, "rb") as f:
+                    f.seek(offsets.get(path, 0))
+                    chunk = f.read()
+                    offsets[path] = f.tell()
+            except FileNotFoundError:
+                continue
+            if ACE_READY_MARKER.encode() in chunk: return True
         return False
 
-async def wait_for_ace_server(force_restart=False):
-    # Если мы уже в режиме перезапуска
-    if force_restart:
-        await stop_ace_server()
-        await start_ace_server_process()
-        await initialize_ace_model()
-    
-    print(f"📡 Проверка связи с ACE (URL: {ACE_API_URL})...")
-    
-    # Проверяем всего 3 раза. Если сервера нет — запускаем!
-    max_checks = 3 if not force_restart else 20
-    for i in range(max_checks):
-        if await is_ace_alive():
-            print("✅ ACE STEP готов к работе!")
+    async def wait_until_ready(self, timeout=ACE_STARTUP_TIMEOUT):
+        """
+        Ждем ровно столько, сколько грузятся веса: опрашиваем health-эндпоинт с короткой
+        нарастающей паузой, а как только в логе появилась метка готовности — проверяем сразу.
+        """
+        started = time.monotonic()
+        deadline = started + timeout
+        delay, offsets = 0.5, {}
+        while time.monotonic() < deadline:
+            if await self.is_alive():
+                print(f"✅ [{self.name}] Сервер поднялся за {int(time.monotonic() - started)} сек.")
+                return True
+            if self.proc and self.proc.poll() is not None:
+                print(f"❌ [{self.name}] ace_wrapper.py завершился с кодом {self.proc.returncode}")
+                return False
+            if self._log_has_ready_marker(offsets):
+                delay = 0.5
+                continue
+            await asyncio.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+            delay = min(delay * 1.5, 5.0)
+        print(f"⏰ [{self.name}] Сервер не поднялся за {timeout} сек.")
+        return False
+
+    async def initialize_model(self):
+        print(f"⚙️  [{self.name}] Инициализация модели в Gradio...")
+        try:
+            checkpoint_response = await asyncio.to_thread(self.client.predict, api_name="/lambda")
+            path = checkpoint_response['choices'][0] if isinstance(checkpoint_response, dict) else checkpoint_response
+            await asyncio.to_thread(
+                self.client.predict,
+                path, MODEL_CONFIG, "cpu", False, LM_MODEL, "vllm", False, True, True, True, True, api_name="/lambda_1"
+            )
+            print(f"✨ [{self.name}] Модель успешно инициализирована!")
             return True
+        except Exception as e:
+            print(f"❌ [{self.name}] Ошибка инициализации: {e}")
+            return False
+
+    async def start_up(self):
+        """Подъем сервера и инициализация модели под одним дедлайном ACE_STARTUP_TIMEOUT."""
+        async def ready():
+            # Модель инициализируем сразу, как только сервер ответил
+            return await self.wait_until_ready() and await self.initialize_model()
+        try:
+            return await asyncio.wait_for(ready(), ACE_STARTUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"⏰ [{self.name}] ACE не готов к работе за {ACE_STARTUP_TIMEOUT} сек.")
+            return False
+
+    async def wait_ready(self, force_restart=False):
+        # Если мы уже в режиме перезапуска
+        if force_restart:
+            await self.stop()
+            if await self.start_process() and await self.start_up():
+                print(f"✅ [{self.name}] ACE STEP готов к работе!")
+                return True
+            print(f"❌ [{self.name}] Не удалось запустить ACE STEP. Проверь {self.log_prefix}_stderr.log")
+            return False
+        
+        print(f"📡 [{self.name}] Проверка связи с ACE (URL: {self.url})...")
+        
+        # Проверяем всего 3 раза с короткой паузой. Если сервера нет — запускаем!
+        for i in range(3):
+            if await self.is_alive():
+                print(f"✅ [{self.name}] ACE STEP готов к работе!")
+                return True
+            print(f"😴 [{self.name}] Ожидание ответа сервера (попытка {i+1}/3)...")
+            await asyncio.sleep(1)
         
-        # Если это первичная проверка и сервер не ответил — не ждем 15 раз!
-        if not force_restart and i >= 2:
-            print("⚠️ Сервер не отвечает. Похоже, он выключен.")
-            break
+        print(f"⚠️ [{self.name}] Сервер не отвечает. Похоже, он выключен.")
+        print(f"🚀 [{self.name}] Начинаю процедуру автоматического запуска ACE STEP...")
+        return await self.wait_ready(force_restart=True)
+
+    def generate_audio_segment(self, caption, lyrics, bpm, key, track_idx=0, total_tracks=0, total_duration_done=0, output_path=None, **overrides):
+        """
+        Генерация одного сегмента аудио через этот экземпляр ACE.
+        track_idx: номер текущего трека
+        total_tracks: примерное общее кол-во треков
+        total_duration_done: сколько секунд уже в альбоме
+        output_path: куда забрать результат этой задачи (файл переносится из кэша Gradio)
+        overrides: любые поля GenerationParams для этого запроса (например, inference_steps=12)
+        """
+        paths = self.generate_audio_takes(caption, lyrics, bpm, key, [output_path], track_idx, total_tracks, total_duration_done, **overrides)
+        return paths[0] if paths else None
+
+    def generate_audio_takes(self, caption, lyrics, bpm, key, output_paths, track_idx=0, total_tracks=0, total_duration_done=0, **overrides):
+        """
+        Несколько дублей одного caption/lyrics за один вызов ACE (batch_size = len(output_paths)):
+        планирование LM и подготовка модели оплачиваются один раз на пачку.
+        Дубль i забирается в output_paths[i] (None — оставить в кэше Gradio).
+        Возвращает пути дублей по порядку (их может прийти меньше, чем просили) или None при ошибке.
+        """
+        takes = len(output_paths)
+        # Замер времени генерации
+        start_time = time.time()
+        try:
+            # КРАСИВЫЙ ВЫВОД В КОНСОЛЬ
+            print(f"\n" + "💿" * 15)
+            tracks = f"{track_idx}-{track_idx + takes - 1}" if takes > 1 else f"{track_idx}"
+            print(f"🎵 [{self.name}] ГЕНЕРАЦИЯ: ТРЕК {tracks} ИЗ ~{total_tracks}")
+            print(f"⏱️  УЖЕ СОБРАНО: {format_time(total_duration_done)}")
+            print(f"🎹 НАСТРОЙКИ: {bpm} BPM | {key}" + (f" | дублей: {takes}" if takes > 1 else ""))
+            print(f"⚙️  ПРОМПТ: {caption[:70]}...")
+            print("💿" * 15 + "\n")
+
+            params = replace(GenerationParams(caption, lyrics, int(bpm), key, audio_duration=int(TRACK_DURATION), batch_size=takes), **overrides)
+
+            result = self.client.generate(params)
             
-        print(f"😴 Ожидание ответа сервера (попытка {i+1}/{max_checks})...")
-        await asyncio.sleep(5)
-    
-    # Если за 3 попытки не ожил — запускаем сами
-    if not force_restart:
-        print("🚀 Начинаю процедуру автоматического запуска ACE STEP...")
-        return await wait_for_ace_server(force_restart=True)
-    
-    print("❌ Не удалось запустить ACE STEP. Проверь ace_stderr.log")
-    return False
+            # Файлы берем только из ответа на этот запрос — никакого поиска "самого свежего" по кэшу
+            paths = extract_audio_paths(result)[:takes]
+            if not paths:
+                print(f"⚠️ [{self.name}] ACE не вернул путь к аудио для трека {tracks}")
+                metrics.ACE_GENERATION_SECONDS.observe(time.time() - start_time, instance=self.name, outcome="no_file")
+                return None
+            if len(paths) < takes:
+                print(f"⚠️ [{self.name}] ACE вернул {len(paths)} дублей из {takes}")
+            
+            paths = [claim_output(path, out) if out else path for path, out in zip(paths, output_paths)]
+            elapsed = time.time() - start_time
+            metrics.ACE_GENERATION_SECONDS.observe(elapsed, instance=self.name, outcome="ok")
+            print(f"✅ [{self.name}] Трек {tracks} сгенерирован за {int(elapsed)} сек.")
+            return paths
+
+        except Exception as e:
+            logger.error(f"❌ [{self.name}] Ошибка в generate_audio_takes: {e}")
+            metrics.ACE_GENERATION_SECONDS.observe(time.time() - start_time, instance=self.name, outcome="error")
+            return None
+
+class AcePool:
+    """
+    Пул экземпляров ACE. Сегменты раздаются свободным экземплярам через acquire()/release();
+    упавший экземпляр перезапускается в фоне и возвращается в пул, остальные не трогаются.
+    """
+
+    def __init__(self, size=ACE_INSTANCES):
+        self.instances = []
+        # Без явных ACE_INSTANCE_CPUS экземпляры делят ядра, не занятые обработкой звука (MEDIA_CPUS)
+        auto_cpus = media_jobs.ace_cpu_sets(size)
+        for i in range(size):
+            url = ACE_API_URL if i == 0 else f"http://127.0.0.1:{ACE_BASE_PORT + i}/"
+            cpus = ACE_INSTANCE_CPUS[i] if i < len(ACE_INSTANCE_CPUS) else auto_cpus[i]
+            self.instances.append(AceInstance(i, url, cpus))
+        self._idle = None
+        self._restarts = set()
+
+    @property
+    def size(self):
+        return len(self.instances)
+
+    @property
+    def idle(self):
+        # Очередь создается лениво, уже внутри работающего event loop
+        if self._idle is None: self._idle = asyncio.Queue()
+        return self._idle
+
+    async def start(self):
+        """Поднимает все экземпляры параллельно. True, если готов хотя бы один."""
+        results = await asyncio.gather(*(inst.wait_ready() for inst in self.instances))
+        for inst, ok in zip(self.instances, results):
+            if ok: self.release(inst)
+            else: self.restart(inst)
+        return any(results)
+
+    async def acquire(self):
+        return await self.idle.get()
+
+    def release(self, inst):
+        self.idle.put_nowait(inst)
+
+    def restart(self, inst):
+        """Перезапуск одного экземпляра в фоне; в пул он вернется, когда оживет."""
+        metrics.ACE_RESTARTS.inc(instance=inst.name)
+        async def _restart():
+            while not await inst.wait_ready(force_restart=True):
+                await asyncio.sleep(30)
+            self.release(inst)
+        task = asyncio.create_task(_restart())
+        self._restarts.add(task)
+        task.add_done_callback(self._restarts.discard)
+
+    async def stop(self):
+        for t in list(self._restarts): t.cancel()
+        await asyncio.gather(*(inst.stop() for inst in self.instances))
+
+    def sweep_caches(self, max_age=ACE_CACHE_MAX_AGE):
+        return sum(sweep_gradio_cache(inst.cache_dir, max_age) for inst in self.instances)
+
+pool = AcePool()
+default_instance = pool.instances[0]
+ace_client = default_instance.client
+
+# Старый интерфейс модуля — все про экземпляр 0
+
+async def is_ace_alive():
+    return await default_instance.is_alive()
+
+async def stop_ace_server():
+    await default_instance.stop()
 
+async def start_ace_server_process():
+    await default_instance.start_process()
+
+async def initialize_ace_model():
+    return await default_instance.initialize_model()
+
+async def wait_for_ace_server(force_restart=False):
+    return await default_instance.wait_ready(force_restart)
 
 def extract_audio_path(result):
-    if not result: return None
+    paths = extract_audio_paths(result)
+    return paths[0] if paths else None
+
+def extract_audio_paths(result):
+    """Все аудиофайлы из ответа Gradio по порядку (у пачки — по одному на дубль), без повторов."""
+    found = []
     def recurse(obj):
-        if isinstance(obj, str) and obj.endswith(('.flac', '.wav', '.mp3')) and os.path.isfile(obj): return obj
-        if isinstance(obj, dict):
+        if isinstance(obj, str):
+            if obj.endswith(('.flac', '.wav', '.mp3')) and os.path.isfile(obj) and obj not in found: found.append(obj)
+        elif isinstance(obj, dict):
             for k in ['path', 'name', 'filename']:
-                if isinstance(obj.get(k), str) and os.path.isfile(obj[k]): return obj[k]
-            for v in obj.values():
-                res = recurse(v)
-                if res: return res
-        if isinstance(obj, (list, tuple)):
-            for i in obj:
-                res = recurse(i)
-                if res: return res
-        return None
-    return recurse(result)
-
-# В ace_engine.py
+                if isinstance(obj.get(k), str) and os.path.isfile(obj[k]):
+                    if obj[k] not in found: found.append(obj[k])
+                    return
+            for v in obj.values(): recurse(v)
+        elif isinstance(obj, (list, tuple)):
+            for i in obj: recurse(i)
+    if result: recurse(result)
+    return found
+
+def claim_output(path, output_path):
+    """Переносит результат задачи из кэша Gradio в папку задачи и убирает опустевшую папку кэша."""
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    shutil.move(path, output_path)
+    parent = os.path.dirname(path)
+    if "gradio" in parent.lower() or parent.startswith(os.path.abspath(ACE_CACHE_DIR)):
+        try: os.rmdir(parent)
+        except OSError: pass
+    return output_path
+
+def sweep_gradio_cache(root, max_age=ACE_CACHE_MAX_AGE):
+    """Janitor: удаляет из кэша Gradio файлы старше max_age сек и пустые папки. Возвращает число удаленных файлов."""
+    if not os.path.isdir(root): return 0
+    removed, now = 0, time.time()
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        for name in filenames:
+            p = os.path.join(dirpath, name)
+            try:
+                if now - os.path.getmtime(p) > max_age:
+                    os.remove(p)
+                    removed += 1
+            except OSError: pass
+        if dirpath != root:
+            try: os.rmdir(dirpath)
+            except OSError: pass
+    return removed
 
 def format_time(seconds):
     """Вспомогательная функция для превращения секунд в 00:00"""
@@ -118,59 +461,5 @@ def format_time(seconds):
     secs = int(seconds % 60)
     return f"{mins:02d}:{secs:02d}"
 
-def generate_audio_segment(caption, lyrics, bpm, key, track_idx=0, total_tracks=0, total_duration_done=0):
-    """
-    Генерация одного сегмента аудио через ACE.
-    track_idx: номер текущего трека
-    total_tracks: примерное общее кол-во треков
-    total_duration_done: сколько секунд уже в альбоме
-    """
-    try:
-        # Вспомогательная функция форматирования времени
-        mins = int(total_duration_done // 60)
-        secs = int(total_duration_done % 60)
-        time_str = f"{mins:02d}:{secs:02d}"
-
-        # КРАСИВЫЙ ВЫВОД В КОНСОЛЬ
-        print(f"\n" + "💿" * 15)
-        print(f"🎵 ГЕНЕРАЦИЯ: ТРЕК {track_idx} ИЗ ~{total_tracks}")
-        print(f"⏱️  УЖЕ СОБРАНО: {time_str}")
-        print(f"🎹 НАСТРОЙКИ: {bpm} BPM | {key}")
-        print(f"⚙️  ПРОМПТ: {caption[:70]}...")
-        print("💿" * 15 + "\n")
-
-        client = Client(ACE_API_URL)
-        
-        # Замер времени генерации
-        start_time = time.time()
-
-        result = client.predict(
-            caption, lyrics, int(bpm), key, "", "unknown", 8, 7.0, True, "-1", None,
-            int(TRACK_DURATION), 1, None, "", 0.0, -1.0, "Fill the audio semantic mask...",
-            1.0, "text2music", False, 0.0, 1.0, 3.0, "ode", "", "flac", 0.85, True,
-            2.0, 0, 0.9, "NO USER INPUT", True, True, True, False, True, False, False, 0.5, 8, "vocals", [], False,
-            api_name="/generation_wrapper"
-        )
-        
-        path = extract_audio_path(result)
-        
-        if path:
-            elapsed = time.time() - start_time
-            print(f"✅ Трек {track_idx} сгенерирован за {int(elapsed)} сек.")
-            return path
-        
-        # Резервный поиск файла в папках Gradio
-        time.sleep(1.5)
-        candidates = glob.glob("/tmp/gradio/**/*.flac", recursive=True) + \
-                     glob.glob("/private/var/folders/*/*/T/gradio/**/*.flac", recursive=True)
-        
-        if candidates:
-            final_path = max(candidates, key=os.path.getmtime)
-            print(f"✅ Трек {track_idx} найден в кэше Gradio.")
-            return final_path
-            
-        return None
-
-    except Exception as e:
-        logger.error(f"❌ Ошибка в generate_audio_segment: {e}")
-        return None
+def generate_audio_segment(caption, lyrics, bpm, key, track_idx=0, total_tracks=0, total_duration_done=0, **overrides):
+    return default_instance.generate_audio_segment(caption, lyrics, bpm, key, track_idx, total_tracks, total_duration_done, **overrides)
@@ -24,29 +24,60 @@ except:
 
 print("🚀 Запускаем acestep напрямую через subprocess...", file=sys.stderr)
 
+def pop_option(args, name, default=None):
+    """Забираем свои опции (их acestep не знает), остальное передаем как есть."""
+    if name in args:
+        i = args.index(name)
+        value = args[i + 1]
+        del args[i:i + 2]
+        return value
+    return default
+
+# Свои опции для пула экземпляров: PID-файл, префикс логов, набор ядер, число потоков
+args = sys.argv[1:]
+pid_file = pop_option(args, "--pid-file", "ace_server.pid")
+log_prefix = pop_option(args, "--log-prefix", "ace")
+cpus = pop_option(args, "--cpus")
+cpus = {int(c) for c in cpus.split(",")} if cpus else None
+threads = pop_option(args, "--threads")
+if threads:
+    # Число потоков OpenMP/BLAS наследует acestep; torch берет его из OMP_NUM_THREADS
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS"):
+        os.environ[var] = threads
+
 # Основная команда — именно так ты запускаешь вручную
-cmd = ["acestep"] + sys.argv[1:]
+cmd = ["acestep"] + args
 
 # Если хочешь явно указать device (на случай если в auto6.py не передаёшь)
-if "--device" not in sys.argv:
+if "--device" not in args:
     cmd += ["--device", "cpu"]
 
+def pin_cpus():
+    # Привязка к ядрам наследуется acestep и всеми его потоками (только Linux)
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+
 print(f"🎯 Команда: {' '.join(shlex.quote(c) for c in cmd)}", file=sys.stderr)
 
 try:
     # Запускаем в фоне, но с правильным выводом логов
     process = subprocess.Popen(
         cmd,
-        stdout=open("ace_stdout.log", "w", buffering=1),
-        stderr=open("ace_stderr.log", "w", buffering=1),
-        text=True
+        stdout=open(f"{log_prefix}_stdout.log", "w", buffering=1),
+        stderr=open(f"{log_prefix}_stderr.log", "w", buffering=1),
+        text=True,
+        preexec_fn=pin_cpus if cpus else None
     )
     print(f"✅ acestep запущен в фоне! PID: {process.pid}", file=sys.stderr)
-    print(f"📋 Логи: ace_stdout.log и ace_stderr.log", file=sys.stderr)
+    print(f"📋 Логи: {log_prefix}_stdout.log и {log_prefix}_stderr.log", file=sys.stderr)
+    if cpus:
+        print(f"🧩 Ядра: {sorted(cpus)}", file=sys.stderr)
+    if threads:
+        print(f"🧵 Потоков OpenMP: {threads}", file=sys.stderr)
     print(f"⏳ Ждём 45–90 секунд пока модель загрузится...", file=sys.stderr)
     
     # Сохраняем PID, чтобы потом можно было убить если что
-    with open("ace_server.pid", "w") as f:
+    with open(pid_file, "w") as f:
         f.write(str(process.pid))
     
     # Держим wrapper живым, чтобы auto6.py не падал
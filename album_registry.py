@@ -0,0 +1,74 @@
+import os
+import json
+import time
+import random
+import logging
+from config import *
+
+logger = logging.getLogger(__name__)
+
+META_NAME = "album.json"
+STATES = ("generating", "rendering", "done")
+
+class AlbumRegistry:
+    """
+    Реестр альбомов в работе. У каждого альбома своя папка segments_<id> и в ней album.json
+    ({"id", "state", "created"}), поэтому после рестарта поднимаются все незавершенные альбомы,
+    а не один из current_metadata.json. Старый current_metadata.json переносится при первом запуске.
+    """
+
+    def __init__(self, base_dir=BASE_TEMP_DIR, legacy_meta=ALBUM_META_FILE):
+        self.base_dir = base_dir
+        os.makedirs(base_dir, exist_ok=True)
+        self._migrate_legacy(legacy_meta)
+
+    def album_dir(self, album_id):
+        return os.path.join(self.base_dir, f"segments_{album_id}")
+
+    def new_album(self):
+        album_id = str(random.randint(10**15, 10**16 - 1))
+        os.makedirs(self.album_dir(album_id), exist_ok=True)
+        self._write(album_id, {"id": album_id, "state": "generating", "created": time.time()})
+        return album_id
+
+    def get(self, album_id):
+        path = os.path.join(self.album_dir(album_id), META_NAME)
+        try:
+            with open(path, "r", encoding="utf-8") as f: return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set_state(self, album_id, state):
+        if state not in STATES: raise ValueError(f"Неизвестное состояние альбома: {state}")
+        meta = self.get(album_id) or {"id": album_id, "created": time.time()}
+        meta["state"] = state
+        meta[f"{state}_at"] = time.time()
+        self._write(album_id, meta)
+
+    def open_albums(self):
+        """ID незавершенных альбомов, старые первыми."""
+        found = []
+        for name in os.listdir(self.base_dir):
+            if not name.startswith("segments_"): continue
+            meta = self.get(name[len("segments_"):])
+            if meta and meta.get("state") != "done":
+                found.append((meta.get("created", 0), meta["id"]))
+        return [album_id for _, album_id in sorted(found)]
+
+    def _write(self, album_id, meta):
+        path = os.path.join(self.album_dir(album_id), META_NAME)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f: json.dump(meta, f)
+        os.replace(tmp, path)
+
+    def _migrate_legacy(self, legacy_meta):
+        if not legacy_meta or not os.path.exists(legacy_meta): return
+        try:
+            with open(legacy_meta, "r") as f: album_id = json.load(f).get("id")
+        except Exception:
+            album_id = None
+        if album_id and self.get(album_id) is None:
+            os.makedirs(self.album_dir(album_id), exist_ok=True)
+            self._write(album_id, {"id": album_id, "state": "generating", "created": time.time()})
+            print(f"📦 Незавершенный альбом {album_id} перенесен в реестр альбомов")
+        os.remove(legacy_meta)
@@ -0,0 +1,66 @@
+import os
+import json
+import logging
+import audio_utils as au
+from config import *
+
+logger = logging.getLogger(__name__)
+
+class RollingRenderer:
+    """
+    Инкрементальный рендер альбома. После каждого принятого сегмента сводим его стык
+    с предыдущим и откладываем готовую, больше не меняющуюся часть в render/chunk_NNN.flac.
+    Последние CROSSFADE_DURATION сек держим в render/tail_NNN.flac до следующего стыка.
+    Финал — это склейка готовых кусков встык плюс хвост, без 48-входового filter graph.
+
+    Шаг идемпотентен: chunk_N и tail_N пишутся под своими номерами, счетчик в render_state.json
+    сдвигается только после записи, а старый хвост удаляется последним — после падения шаг просто повторяется.
+    """
+
+    def __init__(self, seg_dir):
+        self.dir = os.path.join(seg_dir, "render")
+        self.state_path = os.path.join(self.dir, "render_state.json")
+        os.makedirs(self.dir, exist_ok=True)
+        self.rendered = self._load_state()
+
+    def chunk_path(self, idx):
+        return os.path.join(self.dir, f"chunk_{idx:03d}.flac")
+
+    def tail_path(self, idx):
+        return os.path.join(self.dir, f"tail_{idx:03d}.flac")
+
+    def append(self, segment_path):
+        idx = self.rendered
+        prev_tail = self.tail_path(idx - 1) if idx > 0 else None
+        chunk_tmp, tail_tmp = f"{self.chunk_path(idx)}.tmp.flac", f"{self.tail_path(idx)}.tmp.flac"
+
+        au.render_step(segment_path, prev_tail, chunk_tmp, tail_tmp)
+        os.replace(chunk_tmp, self.chunk_path(idx))
+        os.replace(tail_tmp, self.tail_path(idx))
+
+        self.rendered = idx + 1
+        self._save_state()
+        if prev_tail and os.path.exists(prev_tail): os.remove(prev_tail)
+        logger.info(f"🎚️ Рендер: сегмент {idx + 1} сведен в мастер")
+
+    def catch_up(self, segment_files):
+        """После рестарта досводим сегменты, которые уже лежат в папке, но в мастер еще не попали."""
+        for path in segment_files[self.rendered:]:
+            self.append(path)
+
+    def finalize(self, output_path):
+        if self.rendered == 0:
+            raise RuntimeError("Нечего рендерить: нет ни одного сегмента")
+        parts = [self.chunk_path(i) for i in range(self.rendered)] + [self.tail_path(self.rendered - 1)]
+        au.encode_timeline(parts, output_path)
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path): return 0
+        try:
+            with open(self.state_path, "r") as f: return int(json.load(f).get("rendered", 0))
+        except: return 0
+
+    def _save_state(self):
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w") as f: json.dump({"rendered": self.rendered}, f)
+        os.replace(tmp, self.state_path)
@@ -1,13 +1,25 @@
 import os
-import subprocess
+import json
+import math
 import shutil
 import logging
+from concurrent.futures import ThreadPoolExecutor
+import dsp_engine
+import metrics
+import media_jobs
 from config import *
 
 logger = logging.getLogger(__name__)
 
+def use_numpy_engine():
+    """AUDIO_ENGINE = "numpy" включает обработку в процессе (нужны numpy и soundfile), иначе sox/ffmpeg."""
+    return AUDIO_ENGINE == "numpy" and dsp_engine.AVAILABLE
+
+@metrics.instrument("pitch_rise")
 def apply_pitch_rise(input_path, output_path, total_duration, crossfade_duration):
     try:
+        if use_numpy_engine():
+            return dsp_engine.apply_pitch_rise(input_path, output_path, total_duration, crossfade_duration)
         start_time = 0
         end_time = total_duration - crossfade_duration
         if end_time <= 5:
@@ -17,12 +29,13 @@ def apply_pitch_rise(input_path, output_path, total_duration, crossfade_duration
         bend_duration = end_time
         logger.info(f"📈 Pitch Rise: {bend_duration:.1f}с")
         cmd = ['sox', input_path, output_path, 'bend', f'0,-100,{bend_duration}', 'trim', '0', str(total_duration)]
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
+        media_jobs.run(cmd)
         return os.path.exists(output_path) and os.path.getsize(output_path) > 1000
     except Exception as e:
         logger.error(f"❌ SoX error: {e}")
         return False
 
+@metrics.instrument("concat")
 def concat_segments(all_files, output_path):
     """Склейка через FFmpeg acrossfade"""
     if len(all_files) < 2: return
@@ -43,4 +56,171 @@ def concat_segments(all_files, output_path):
         '-filter_complex', filter_complex,
         '-c:a', 'aac', '-b:a', '128k', '-ar', '44100', '-ac', '2', output_path
     ]
-    subprocess.run(cmd, check=True)
+    media_jobs.run(cmd)
+
+def get_audio_info(path):
+    """(sample_rate, кол-во сэмплов) первой аудиодорожки через ffprobe."""
+    cmd = [
+        'ffprobe', '-v', 'error', '-select_streams', 'a:0',
+        '-show_entries', 'stream=sample_rate,duration_ts,duration', '-of', 'json', path
+    ]
+    out = media_jobs.run(cmd).stdout
+    stream = json.loads(out)["streams"][0]
+    sr = int(stream["sample_rate"])
+    samples = int(stream.get("duration_ts") or round(float(stream["duration"]) * sr))
+    return sr, samples
+
+@metrics.instrument("render_step")
+def render_step(segment_path, prev_tail, chunk_path, tail_path, crossfade_duration=CROSSFADE_DURATION):
+    """
+    Один шаг инкрементального рендера: хвост предыдущего шага (crossfade_duration сек)
+    сводится с началом нового сегмента тем же acrossfade, что и в concat_segments.
+    Все, кроме последних crossfade_duration сек, уходит в chunk_path (больше не меняется),
+    остаток — в tail_path для следующего стыка. Для первого сегмента prev_tail=None.
+    """
+    if use_numpy_engine():
+        return dsp_engine.render_step(segment_path, prev_tail, chunk_path, tail_path, crossfade_duration)
+    sr, samples = get_audio_info(segment_path)
+    cut = samples - int(crossfade_duration * sr)
+    if cut <= 0:
+        raise ValueError(f"Сегмент {segment_path} короче кроссфейда")
+
+    if prev_tail:
+        inputs = ['-i', prev_tail, '-i', segment_path]
+        head = f"[0:a][1:a]acrossfade=d={crossfade_duration}:c1=tri:c2=tri,"
+    else:
+        inputs = ['-i', segment_path]
+        head = "[0:a]"
+    filter_complex = (
+        f"{head}asplit=2[a][b]; "
+        f"[a]atrim=end_sample={cut}[chunk]; "
+        f"[b]atrim=start_sample={cut},asetpts=N/SR/TB[tail]"
+    )
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', *inputs,
+        '-filter_complex', filter_complex,
+        '-map', '[chunk]', '-c:a', 'flac', chunk_path,
+        '-map', '[tail]', '-c:a', 'flac', tail_path
+    ]
+    media_jobs.run(cmd)
+
+AAC_RATE = 44100
+AAC_FRAME = 1024          # сэмплов в кадре AAC; задержка (priming) энкодера ffmpeg — тоже один кадр
+MIN_STEPS_PER_JOB = 8     # короче этого кусок не режем — пре-ролл съест весь выигрыш
+
+@metrics.instrument("final_encode")
+def encode_timeline(parts, output_path, jobs=FINAL_ENCODE_JOBS):
+    """
+    Склеивает уже сведенные куски встык и кодирует в AAC. При jobs > 1 (0 — по числу слотов media_jobs)
+    таймлайн кодируется параллельными кусками (encode_timeline_parallel), при сбое — одним процессом.
+    """
+    jobs = jobs or media_jobs.jobs.limit
+    if jobs > 1:
+        try:
+            return encode_timeline_parallel(parts, output_path, jobs)
+        except Exception as e:
+            logger.warning(f"⚠️ Параллельный финальный рендер не удался, кодирую одним процессом: {e}")
+    return _encode_timeline_single(parts, output_path)
+
+def _concat_list(parts, list_path):
+    with open(list_path, "w", encoding="utf-8") as f:
+        for p in parts:
+            f.write("file '{}'\n".format(os.path.abspath(p).replace("'", "'\\''")))
+
+def _encode_timeline_single(parts, output_path):
+    """Concat demuxer, без filter graph, один процесс ffmpeg."""
+    list_path = f"{output_path}.parts.txt"
+    _concat_list(parts, list_path)
+    try:
+        cmd = [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+            '-f', 'concat', '-safe', '0', '-i', list_path,
+            '-c:a', 'aac', '-b:a', '128k', '-ar', str(AAC_RATE), '-ac', '2', output_path
+        ]
+        media_jobs.run(cmd)
+    finally:
+        if os.path.exists(list_path): os.remove(list_path)
+
+# --- Параллельный финальный рендер ---
+
+def _split_step(sr_in):
+    """Шаг сетки разрезов в сэмплах 44.1 кГц: кратен кадру AAC и попадает в целый входной сэмпл."""
+    return math.lcm(AAC_FRAME, AAC_RATE // math.gcd(AAC_RATE, sr_in))
+
+def _adts_frames(path):
+    """Кадры ADTS-файла (у ffmpeg один raw data block на кадр)."""
+    with open(path, "rb") as f: data = f.read()
+    frames, i = [], 0
+    while i < len(data):
+        if i + 7 > len(data) or data[i] != 0xFF or (data[i + 1] & 0xF0) != 0xF0:
+            raise ValueError(f"{path}: битый ADTS на смещении {i}")
+        length = ((data[i + 3] & 0x03) << 11) | (data[i + 4] << 3) | (data[i + 5] >> 5)
+        frames.append(data[i:i + length])
+        i += length
+    return frames
+
+def encode_timeline_parallel(parts, output_path, jobs):
+    """
+    Таймлайн режется на jobs кусков в точках сетки _split_step (внутри уже сведенного звука, не на кроссфейдах).
+    Кусок k кодируется отдельным ffmpeg с пре-роллом в один шаг до своего начала и пост-роллом после конца:
+    к первому нужному кадру энкодер, ресэмплер и перекрытие MDCT уже "разогреты" тем же звуком, что и
+    в монолитном кодировании. Из ADTS-потоков берутся ровно свои кадры (кадр j куска со стартом a
+    покрывает сэмплы [a + (j-1)*1024, a + j*1024)), склеиваются и без перекодирования упаковываются в m4a.
+    """
+    infos = [get_audio_info(p) for p in parts]
+    sr_in = infos[0][0]
+    if any(sr != sr_in for sr, _ in infos):
+        raise ValueError("куски таймлайна с разной частотой дискретизации")
+    starts = [0]
+    for _, n in infos: starts.append(starts[-1] + n)
+    total_out = starts[-1] * AAC_RATE // sr_in
+
+    step = _split_step(sr_in)
+    n_steps = total_out // step
+    jobs = min(jobs, n_steps // MIN_STEPS_PER_JOB)
+    if jobs < 2:
+        return _encode_timeline_single(parts, output_path)
+    cuts = [0] + [round(k * n_steps / jobs) * step for k in range(1, jobs)]   # начала кусков, сэмплы 44.1 кГц
+
+    work = f"{output_path}.chunks"
+    os.makedirs(work, exist_ok=True)
+    try:
+        def encode(k):
+            # Пре-ролл: кодировать начинаем на шаг раньше своего начала (кроме первого куска)
+            a_out = cuts[k] - step if k > 0 else 0
+            a_in = a_out * sr_in // AAC_RATE
+            end_in = (cuts[k + 1] + step) * sr_in // AAC_RATE if k + 1 < len(cuts) else starts[-1]
+            # Берем только нужные входные файлы; нумеруем сэмплы заново (asetpts), чтобы atrim резал точно
+            first = max(i for i in range(len(parts)) if starts[i] <= a_in)
+            last = min(i for i in range(1, len(starts)) if starts[i] >= end_in)
+            list_path = os.path.join(work, f"part_{k:03d}.txt")
+            _concat_list(parts[first:last], list_path)
+            out = os.path.join(work, f"part_{k:03d}.aac")
+            cmd = [
+                'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+                '-f', 'concat', '-safe', '0', '-i', list_path,
+                '-af', f"asetpts=N/SR/TB,atrim=start_sample={a_in - starts[first]}:end_sample={end_in - starts[first]},"
+                       f"asetpts=N/SR/TB,aresample={AAC_RATE}",
+                '-c:a', 'aac', '-b:a', '128k', '-ac', '2', '-f', 'adts', out
+            ]
+            media_jobs.run(cmd)
+            return a_out, out
+
+        logger.info(f"🧵 Финальный рендер: {len(cuts)} кусков параллельно")
+        with ThreadPoolExecutor(max_workers=len(cuts)) as pool:
+            encoded = list(pool.map(encode, range(len(cuts))))
+
+        joined = os.path.join(work, "joined.aac")
+        with open(joined, "wb") as f:
+            for k, (a_out, path) in enumerate(encoded):
+                frames = _adts_frames(path)
+                lo = (cuts[k] - a_out) // AAC_FRAME          # первый свой кадр (после пре-ролла)
+                hi = (cuts[k + 1] - a_out) // AAC_FRAME if k + 1 < len(cuts) else len(frames)
+                if hi > len(frames):
+                    raise ValueError(f"кусок {k}: {len(frames)} кадров, нужно {hi}")
+                f.write(b"".join(frames[lo:hi]))
+
+        cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-i', joined, '-c', 'copy', output_path]
+        media_jobs.run(cmd)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+autotune_cpus.py — подбор разбиения ядер между ACE и обработкой звука (MEDIA_CPUS / ACE_THREADS).
+Для каждого варианта "k ядер под sox/ffmpeg, остальные — ACE" перезапускает экземпляры ACE с новой
+привязкой и числом потоков, генерирует --segments сегментов и параллельно, как в main.py, обрабатывает
+их (pitch rise + сведение в мастер) через media_jobs на выделенных ядрах. Печатает сегменты/час
+от первой генерации до последнего сведения и лучший вариант для config.py.
+k = 0 — без привязки: ACE и обработка делят все ядра, как раньше.
+Запуск: python3 autotune_cpus.py [--media 0,1,2] [--segments 4]
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import ace_engine as ace
+import audio_utils as au
+import media_jobs
+from album_renderer import RollingRenderer
+from config import *
+
+CAPTION = "Deep house pop, 126 bpm, warm analog bass, airy female vocals, lush pads"
+LYRICS = "\n".join(["[verse]"] + ["Огни ночного города горят", "Мы танцуем до утра опять"] * 4 +
+                   ["[chorus]"] + ["Сердце бьется в такт басам", "Никто не спит, никто не ждет"] * 2)
+
+async def apply_split(media_cpus):
+    """Ядра под обработку и перезапуск ACE на оставшихся. False, если ACE не поднялся."""
+    media_jobs.jobs.configure(cpus=media_cpus)
+    pool = ace.pool
+    for inst, cpus in zip(pool.instances, media_jobs.ace_cpu_sets(pool.size, media_cpus)):
+        inst.cpus = cpus
+    results = await asyncio.gather(*(inst.wait_ready(force_restart=True) for inst in pool.instances))
+    return all(results)
+
+async def run_split(segments, work_dir):
+    """Сегменты/час на текущем разбиении: генерация на всех экземплярах, обработка строго по порядку."""
+    os.makedirs(work_dir, exist_ok=True)
+    renderer = RollingRenderer(work_dir)
+    ready = {}
+    next_idx = iter(range(0, segments, ACE_BATCH_SIZE))
+    done = asyncio.Condition()
+
+    async def ace_worker(inst):
+        for first in next_idx:
+            takes = min(ACE_BATCH_SIZE, segments - first)
+            outs = [os.path.join(work_dir, f"gen_{first + i:03d}.flac") for i in range(takes)]
+            paths = await asyncio.to_thread(inst.generate_audio_takes, CAPTION, LYRICS, 126, "Am", outs, first + 1, segments)
+            if not paths or len(paths) < takes:
+                raise RuntimeError(f"{inst.name} не сгенерировал сегменты {first + 1}-{first + takes}")
+            async with done:
+                for i, path in enumerate(paths): ready[first + i] = path
+                done.notify_all()
+
+    async def post_processor():
+        for idx in range(segments):
+            async with done:
+                await done.wait_for(lambda: idx in ready)
+            target = os.path.join(work_dir, f"segment_{idx:03d}.flac")
+            if idx == 0 or not await asyncio.to_thread(au.apply_pitch_rise, ready[idx], target, TRACK_DURATION, CROSSFADE_DURATION):
+                shutil.copy(ready[idx], target)
+            await asyncio.to_thread(renderer.append, target)
+
+    started = time.perf_counter()
+    await asyncio.gather(post_processor(), *(ace_worker(inst) for inst in ace.pool.instances))
+    return segments / (time.perf_counter() - started) * 3600
+
+async def autotune(args):
+    media_jobs.jobs.bind()
+    cpus = media_jobs.all_cpus()
+    counts = [int(x) for x in args.media.split(",")] if args.media else list(range(0, len(cpus) // 2 + 1))
+    out_dir = tempfile.mkdtemp(prefix="autotune_cpus_")
+    results = {}
+    try:
+        for k in counts:
+            if k >= len(cpus):
+                print(f"⚠️ {k} ядер под обработку — ACE ничего не останется, пропускаю")
+                continue
+            media = cpus[len(cpus) - k:] if k else []
+            print(f"\n🧩 Обработка: {media or 'без привязки'} | ACE: {[i.cpus for i in ace.pool.instances] if k else 'все ядра'}")
+            if not await apply_split(media):
+                print("❌ ACE не поднялся на этом разбиении, пропускаю")
+                continue
+            results[k] = await run_split(args.segments, os.path.join(out_dir, f"media_{k}"))
+            print(f"⏱️  {results[k]:.1f} сегментов/час")
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        await ace.pool.stop()
+
+    if not results:
+        print("❌ Ни одно разбиение не отработало")
+        return 1
+    print(f"\n{'ЯДЕР ОБРАБОТКЕ':>14} {'СЕГМЕНТОВ/ЧАС':>14}")
+    for k, rate in results.items(): print(f"{k:>14} {rate:>14.1f}")
+    best = max(results, key=results.get)
+    media = cpus[len(cpus) - best:] if best else []
+    threads = len(media_jobs.ace_cpu_sets(ace.pool.size, media)[0] or []) if media else 0
+    print(f"✅ Лучше всего: MEDIA_CPUS = {media}, ACE_THREADS = {threads} ({results[best]:.1f} сегментов/час)")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Подбор разбиения ядер между ACE и sox/ffmpeg по сегментам в час")
+    parser.add_argument("--media", default="", help="сколько ядер отдавать обработке, через запятую (по умолчанию 0..половина ядер)")
+    parser.add_argument("--segments", type=int, default=4, help="сколько сегментов генерировать на каждый вариант")
+    return asyncio.run(autotune(parser.parse_args()))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+bench_batch.py — подбор ACE_BATCH_SIZE на этой машине. Гоняет настоящий ACE (экземпляр 0 или --url,
+если сервер не отвечает — поднимает его как main.py) пачками по 1, 2, 3... дубля одного текста,
+меряет время вызова и печатает сегменты/час для каждого размера пачки и лучший размер.
+Пачку, на которую не хватило памяти или которая вернулась пустой, дальше не увеличиваем.
+Запуск: python3 bench_batch.py [--sizes 1,2,3,4] [--repeats 2] [--steps 8]
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import statistics
+import ace_engine as ace
+from config import *
+
+CAPTION = "Deep house pop, 126 bpm, warm analog bass, airy female vocals, lush pads"
+LYRICS = "\n".join(["[verse]"] + ["Огни ночного города горят", "Мы танцуем до утра опять"] * 4 +
+                   ["[chorus]"] + ["Сердце бьется в такт басам", "Никто не спит, никто не ждет"] * 2)
+
+def run_batch(inst, size, out_dir, tag, overrides):
+    """Один вызов ACE на size дублей: (секунды, сколько дублей пришло) или None при ошибке."""
+    outs = [os.path.join(out_dir, f"{tag}_{i}.flac") for i in range(size)]
+    start = time.perf_counter()
+    paths = inst.generate_audio_takes(CAPTION, LYRICS, 126, "Am", outs, **overrides)
+    elapsed = time.perf_counter() - start
+    for path in paths or []:
+        if os.path.exists(path): os.remove(path)
+    return (elapsed, len(paths)) if paths else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Подбор размера пачки ACE по сегментам в час")
+    parser.add_argument("--sizes", default="1,2,3,4", help="размеры пачки через запятую")
+    parser.add_argument("--repeats", type=int, default=2, help="сколько вызовов на каждый размер")
+    parser.add_argument("--warmup", type=int, default=1, help="сколько вызовов по 1 дублю перед замерами (не считаются)")
+    parser.add_argument("--steps", type=int, default=0, help="inference_steps (по умолчанию — как в GenerationParams)")
+    parser.add_argument("--url", default="", help="адрес уже запущенного ACE вместо экземпляра 0")
+    args = parser.parse_args()
+
+    inst = ace.AceInstance(0, args.url) if args.url else ace.default_instance
+    if not asyncio.run(inst.wait_ready()):
+        print("🛑 ACE не поднялся, замерять нечего")
+        return 1
+    overrides = {"inference_steps": args.steps} if args.steps else {}
+    sizes = [int(x) for x in args.sizes.split(",")]
+    out_dir = tempfile.mkdtemp(prefix="bench_batch_")
+    results = {}
+    try:
+        for i in range(args.warmup):
+            print(f"🔥 Прогрев {i + 1}/{args.warmup}...")
+            run_batch(inst, 1, out_dir, f"warmup{i}", overrides)
+        for size in sizes:
+            runs = []
+            for r in range(args.repeats):
+                res = run_batch(inst, size, out_dir, f"b{size}_{r}", overrides)
+                if res is None: break
+                runs.append(res)
+                print(f"⏱️  Пачка {size}: {res[0]:.1f} сек, дублей {res[1]}")
+            if len(runs) < args.repeats:
+                print(f"⚠️ Пачка {size} не прошла, большие размеры не пробуем")
+                break
+            results[size] = statistics.median(sec / takes for sec, takes in runs)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    if not results:
+        print("❌ Ни одна пачка не прошла")
+        return 1
+    base = results.get(1)
+    print(f"\n{'ПАЧКА':>5} {'СЕК/СЕГМЕНТ':>12} {'СЕГМЕНТОВ/ЧАС':>14} {'К ПАЧКЕ 1':>10}")
+    for size, per_segment in results.items():
+        speedup = f"{base / per_segment:.2f}x" if base else "-"
+        print(f"{size:>5} {per_segment:>12.1f} {3600 / per_segment:>14.1f} {speedup:>10}")
+    best = min(results, key=results.get)
+    print(f"✅ Лучше всего: ACE_BATCH_SIZE = {best} ({3600 / results[best]:.1f} сегментов/час на экземпляр ACE)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+bench_dsp.py — сравнение движков обработки: sox/ffmpeg против dsp_engine (numpy).
+Генерирует синтетические сегменты, гоняет pitch rise и шаг рендера обоими путями,
+печатает время и расхождение. Запуск: python3 bench_dsp.py [кол-во сегментов]
+"""
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import soundfile as sf
+import audio_utils as au
+import dsp_engine
+from config import *
+
+SR = 48000
+PITCH_TOLERANCE_CENTS = 10      # допустимое расхождение высоты тона с sox
+CROSSFADE_TOLERANCE = 1e-4      # допустимое расхождение сэмплов с ffmpeg acrossfade
+
+def make_segment(path, freq, seconds=TRACK_DURATION):
+    t = np.arange(int(seconds * SR)) / SR
+    tone = 0.3 * np.sin(2 * np.pi * freq * t) * (1 + 0.5 * np.sin(2 * np.pi * 2 * t))
+    sf.write(path, np.stack([tone, tone], axis=1).astype(np.float32), SR, subtype="PCM_24")
+
+def dominant_freq(x):
+    spec = np.abs(np.fft.rfft(x * np.hanning(len(x)), n=len(x) * 8))
+    return np.argmax(spec) * SR / (len(x) * 8)
+
+def pitch_track(path, points):
+    data, _ = sf.read(path, always_2d=True)
+    return [dominant_freq(data[int(p * SR):int(p * SR) + 8192, 0]) for p in points]
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+def with_engine(engine, fn, *args):
+    au.AUDIO_ENGINE = engine
+    return timed(fn, *args)
+
+def main():
+    if not dsp_engine.AVAILABLE:
+        print("❌ Нужны numpy и soundfile: pip install numpy soundfile")
+        return 1
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        segs = [os.path.join(tmp, f"seg_{i}.flac") for i in range(n)]
+        for i, p in enumerate(segs): make_segment(p, 220 * 2 ** (i / 12))
+
+        # 1. Pitch rise
+        times = {"sox": 0.0, "numpy": 0.0}
+        points = [1, TRACK_DURATION / 3, TRACK_DURATION - CROSSFADE_DURATION - 1, TRACK_DURATION - 1]
+        for i, p in enumerate(segs):
+            outs = {e: os.path.join(tmp, f"pitch_{e}_{i}.flac") for e in times}
+            for e in times:
+                times[e] += with_engine(e, au.apply_pitch_rise, p, outs[e], TRACK_DURATION, CROSSFADE_DURATION)
+            a, b = sf.info(outs["sox"]).frames, sf.info(outs["numpy"]).frames
+            cents = [abs(1200 * np.log2(y / x)) for x, y in zip(pitch_track(outs["sox"], points), pitch_track(outs["numpy"], points))]
+            if a != b or max(cents) > PITCH_TOLERANCE_CENTS:
+                ok = False
+                print(f"⚠️ Сегмент {i}: длина sox={a} numpy={b}, расхождение высоты до {max(cents):.1f} центов")
+        print(f"📈 Pitch rise x{n}: sox {times['sox']:.2f}с | numpy {times['numpy']:.2f}с")
+
+        # 2. Шаг рендера (кроссфейд + обрезка)
+        times = {"sox": 0.0, "numpy": 0.0}
+        worst = 0.0
+        for e in times:
+            prev = None
+            for i, p in enumerate(segs):
+                chunk, tail = os.path.join(tmp, f"chunk_{e}_{i}.flac"), os.path.join(tmp, f"tail_{e}_{i}.flac")
+                times[e] += with_engine(e, au.render_step, p, prev, chunk, tail)
+                prev = tail
+        for i in range(n):
+            for kind in ("chunk", "tail"):
+                x, _ = sf.read(os.path.join(tmp, f"{kind}_sox_{i}.flac"))
+                y, _ = sf.read(os.path.join(tmp, f"{kind}_numpy_{i}.flac"))
+                if x.shape != y.shape:
+                    ok = False
+                    print(f"⚠️ {kind} {i}: форма ffmpeg={x.shape} numpy={y.shape}")
+                    continue
+                worst = max(worst, float(np.abs(x - y).max()))
+        ok = ok and worst <= CROSSFADE_TOLERANCE
+        print(f"🎚️ Рендер x{n}: ffmpeg {times['sox']:.2f}с | numpy {times['numpy']:.2f}с | макс. расхождение {worst:.2e}")
+
+    print("✅ Движки совпадают в пределах допуска" if ok else "❌ Движки расходятся сильнее допуска")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
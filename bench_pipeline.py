@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+bench_pipeline.py — офлайн-бенчмарк всего конвейера main.py без сети, GPU и Telegram.
+Вместо ACE поднимаются фейковые Gradio-серверы (те же api_name, отдают синтетический FLAC
+с задержкой), вместо g4f — фейковые провайдеры с задержкой, ошибками и отказами, вместо
+tg_handler — пустой приемник. Собирается один альбом на TARGET_TOTAL_SECONDS, в конце — отчет:
+сегменты/час, простой ACE в ожидании текстов, время по стадиям и время финального рендера.
+
+Нужны gradio и ffmpeg (sox — если AUDIO_ENGINE = "sox"). Запуск:
+    python3 bench_pipeline.py --ace-delay 3 --llm-latency 1 --llm-fail 0.2 --llm-deny 0.1
+    python3 bench_pipeline.py --instances 2 --seconds 900 --set AUDIO_ENGINE="'numpy'"
+    python3 bench_pipeline.py --ace-fixed 0.4 --set ACE_BATCH_SIZE=4
+"""
+import os
+import sys
+import ast
+import glob
+import time
+import types
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import functools
+import itertools
+import threading
+import subprocess
+from collections import defaultdict
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_PROVIDERS = {"BenchFast": 0.5, "BenchSteady": 1.0, "BenchSlow": 2.5}   # имя -> множитель задержки
+DENIAL_REPLY = "As an AI, I cannot help with that request."
+
+# --- Фейковый ACE (запускается отдельным процессом: python3 bench_pipeline.py --serve-ace PORT) ---
+
+def make_flac(path, seconds, freq=220):
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error", "-f", "lavfi", "-i", f"sine=frequency={freq}:sample_rate=48000:duration={seconds}",
+        "-ac", "2", "-c:a", "flac", path
+    ], check=True)
+
+def serve_ace(port, delay, duration, fixed):
+    import gradio as gr
+    import ace_engine as ace
+    from dataclasses import fields
+
+    out_dir = os.path.abspath(f"fake_ace_out_{port}")
+    os.makedirs(out_dir, exist_ok=True)
+    template = os.path.join(out_dir, "template.flac")
+    make_flac(template, duration)
+    counter = itertools.count()
+
+    def checkpoints():
+        return {"choices": ["./checkpoints"]}
+
+    def init_model(*args):
+        return "ok"
+
+    names = [f.name for f in fields(ace.GenerationParams)]
+    batch_at = names.index("batch_size")
+
+    def generate(*args):
+        # Пачка из n дублей: доля fixed задержки платится один раз на вызов, остальное — за каждый дубль
+        takes = int(args[batch_at] or 1)
+        time.sleep(delay * (fixed + (1 - fixed) * takes))
+        outs = []
+        for _ in range(takes):
+            outs.append(os.path.join(out_dir, f"take_{next(counter):05d}.flac"))
+            shutil.copy(template, outs[-1])
+        return outs
+
+    n_args = len(names)
+    with gr.Blocks() as demo:
+        trigger = gr.Button(visible=False)
+        trigger.click(checkpoints, None, gr.JSON(), api_name="lambda")
+        trigger.click(init_model, [gr.JSON() for _ in range(11)], gr.Textbox(), api_name="lambda_1")
+        trigger.click(generate, [gr.JSON() for _ in range(n_args)], gr.Files(), api_name="generation_wrapper")
+    # Как и настоящий ACE, каждый экземпляр генерирует строго по одному запросу
+    demo.queue(default_concurrency_limit=1).launch(server_name="127.0.0.1", server_port=port, show_error=True)
+
+def start_fake_ace(ports, delay, duration, fixed):
+    procs = []
+    for i, port in enumerate(ports):
+        env = dict(os.environ, GRADIO_TEMP_DIR=os.path.abspath(os.path.join("ace_cache", f"instance_{i}")), GRADIO_ANALYTICS_ENABLED="False")
+        log = open(f"fake_ace_{port}.log", "w")
+        procs.append(subprocess.Popen(
+            [sys.executable, os.path.join(REPO_DIR, "bench_pipeline.py"), "--serve-ace", str(port),
+             "--ace-delay", str(delay), "--ace-fixed", str(fixed), "--track", str(duration)],
+            stdout=log, stderr=subprocess.STDOUT, env=env
+        ))
+    import requests
+    deadline = time.monotonic() + 120
+    for port, proc in zip(ports, procs):
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"Фейковый ACE на порту {port} упал, см. fake_ace_{port}.log")
+            try:
+                if requests.get(f"http://127.0.0.1:{port}/", timeout=2).status_code == 200: break
+            except requests.RequestException: pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Фейковый ACE на порту {port} не поднялся")
+            time.sleep(0.5)
+    return procs
+
+# --- Фейковые g4f и tg_handler ---
+
+def fake_g4f(latency, fail_rate, deny_rate, rng):
+    module = types.ModuleType("g4f")
+    module.Provider = types.SimpleNamespace(**{name: type(name, (), {"scale": scale}) for name, scale in BENCH_PROVIDERS.items()})
+    lock = threading.Lock()
+
+    def create(model, provider, messages, stream=False, timeout=None):
+        with lock:
+            delay = rng.expovariate(1 / max(latency * provider.scale, 1e-3))
+            roll = rng.random()
+        time.sleep(delay)
+        if roll < fail_rate:
+            raise ConnectionError(f"{provider.__name__}: fake failure")
+        if roll < fail_rate + deny_rate:
+            return DENIAL_REPLY
+        if "песню" in messages[-1]["content"]:
+            return "\n".join(f"Bench line {i} from {provider.__name__} ({model})" for i in range(16))
+        return "Deep house pop, 126 bpm, warm analog bass, airy female vocals, lush pads"
+
+    module.ChatCompletion = types.SimpleNamespace(create=create)
+    return module
+
+def fake_tg(uploads):
+    module = types.ModuleType("tg_handler")
+
+    class Client:
+        async def start(self): pass
+        async def disconnect(self): pass
+
+    async def send_to_telegram(path, album_id):
+        uploads.append((path, album_id, os.path.getsize(path) if os.path.exists(path) else 0))
+
+    module.client_tg = Client()
+    module.send_to_telegram = send_to_telegram
+    return module
+
+# --- Замеры ---
+
+class StageTimer:
+    """Суммарное время и число вызовов по стадиям; годится и для корутин, и для функций в to_thread."""
+
+    def __init__(self):
+        self.total = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.total[stage] += seconds
+            self.calls[stage] += 1
+
+    def wrap(self, stage, fn):
+        if asyncio.iscoroutinefunction(fn):
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try: return await fn(*args, **kwargs)
+                finally: self.add(stage, time.perf_counter() - start)
+        else:
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try: return fn(*args, **kwargs)
+                finally: self.add(stage, time.perf_counter() - start)
+        return functools.wraps(fn)(wrapper)
+
+def parse_overrides(pairs):
+    overrides = {}
+    for pair in pairs:
+        key, _, value = pair.partition("=")
+        try: overrides[key.strip()] = ast.literal_eval(value)
+        except (ValueError, SyntaxError): overrides[key.strip()] = value
+    return overrides
+
+def prepare_workdir(workdir):
+    """Рабочая папка бенча: копии базы текстов и промптов, свой список провайдеров, все состояние — внутри."""
+    for name in ("collected_lyrics.txt", "prompt_caption.txt", "prompt_lyrics.txt", "prompt_caption_task.txt", "denials.txt"):
+        src = os.path.join(REPO_DIR, name)
+        if os.path.exists(src): shutil.copy(src, workdir)
+    with open(os.path.join(workdir, "providers_list.txt"), "w", encoding="utf-8") as f:
+        for name in BENCH_PROVIDERS: f.write(f"{name}: bench-small, bench-large\n")
+
+def run(args):
+    import config
+    ports = [args.port + i for i in range(args.instances)]
+    overrides = {
+        "ACE_INSTANCES": args.instances, "ACE_API_URL": f"http://127.0.0.1:{ports[0]}/", "ACE_BASE_PORT": args.port,
+        "TRACK_DURATION": args.track, "ALBUMS_TO_GENERATE": 1, "PROVIDER_STATS_FLUSH_SECONDS": 10 ** 9, "METRICS_PORT": 0,
+    }
+    if args.seconds: overrides["TARGET_TOTAL_SECONDS"] = args.seconds
+    overrides.update(parse_overrides(args.set))
+    # Переопределяем config ДО импорта остальных модулей: они берут значения через from config import *
+    for key, value in overrides.items(): setattr(config, key, value)
+
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    uploads = []
+    sys.modules["g4f"] = fake_g4f(args.llm_latency, args.llm_fail, args.llm_deny, rng)
+    sys.modules["tg_handler"] = fake_tg(uploads)
+
+    print(f"🧪 Поднимаю фейковый ACE: {len(ports)} шт., задержка {args.ace_delay} сек...")
+    procs = start_fake_ace(ports, args.ace_delay, config.TRACK_DURATION, args.ace_fixed)
+    try:
+        import main
+        import lyrics_manager as lm
+        import audio_utils as au
+        import ace_engine as ace
+        import album_renderer
+        import text_spool
+
+        timer = StageTimer()
+        lm.get_text_from_llm = timer.wrap("llm", lm.get_text_from_llm)
+        ace.AceInstance.generate_audio_takes = timer.wrap("ace", ace.AceInstance.generate_audio_takes)
+        au.apply_pitch_rise = timer.wrap("pitch", au.apply_pitch_rise)
+        au.render_step = timer.wrap("concat", au.render_step)
+        au.concat_segments = timer.wrap("final", au.concat_segments)
+        album_renderer.RollingRenderer.finalize = timer.wrap("final", album_renderer.RollingRenderer.finalize)
+        # get() спула ждет только когда текстов нет — все время внутри него и есть простой ACE без текстов
+        text_spool.TextSpool.get = timer.wrap("starved", text_spool.TextSpool.get)
+
+        started = time.perf_counter()
+        asyncio.run(main.main())
+        wall = time.perf_counter() - started
+    finally:
+        for p in procs: p.terminate()
+        for p in procs: p.wait()
+
+    segments = len(glob.glob(os.path.join(config.BASE_TEMP_DIR, "segments_*", "segment_*.flac")))
+    print_report(config, timer, wall, segments, uploads)
+    return 0 if uploads else 1
+
+def print_report(config, timer, wall, segments, uploads):
+    print(f"\n{'='*60}")
+    print(f"📊 ОТЧЕТ БЕНЧМАРКА (альбом на {config.TARGET_TOTAL_SECONDS} сек, {config.ACE_INSTANCES} ACE x{config.ACE_BATCH_SIZE} дублей, движок {config.AUDIO_ENGINE})")
+    print(f"⏱️  Всего: {wall:.1f} сек | сегментов: {segments} | {segments / wall * 3600:.1f} сегментов/час")
+    print(f"😴 ACE ждал тексты: {timer.total['starved']:.1f} сек (на {timer.calls['starved']} получений текста)")
+    labels = {"llm": "LLM (caption/lyrics)", "ace": "ACE генерация", "pitch": "Pitch rise", "concat": "Сведение стыков", "final": "Финальный рендер"}
+    for stage, label in labels.items():
+        n = timer.calls[stage]
+        avg = timer.total[stage] / n if n else 0.0
+        print(f"   {label:<22} {timer.total[stage]:>9.1f} сек  x{n:<4} (в среднем {avg:.2f} сек)")
+    for path, album_id, size in uploads:
+        print(f"📤 Альбом {album_id}: {path} ({size / 1024 / 1024:.1f} МБ)")
+    if not uploads: print("❌ Альбом не дошел до отправки")
+    print(f"{'='*60}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк конвейера с фейковыми ACE, g4f и Telegram")
+    parser.add_argument("--seconds", type=int, default=0, help="длина альбома (по умолчанию TARGET_TOTAL_SECONDS из config)")
+    parser.add_argument("--track", type=int, default=90, help="длина сегмента, сек")
+    parser.add_argument("--instances", type=int, default=1, help="сколько фейковых ACE поднять")
+    parser.add_argument("--port", type=int, default=17860, help="порт первого фейкового ACE")
+    parser.add_argument("--ace-delay", type=float, default=2.0, help="сколько фейковый ACE 'генерирует' сегмент, сек")
+    parser.add_argument("--ace-fixed", type=float, default=0.3, help="доля задержки фейкового ACE, которая платится раз на вызов, а не за дубль")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="средняя задержка фейкового провайдера, сек")
+    parser.add_argument("--llm-fail", type=float, default=0.1, help="доля ответов с ошибкой")
+    parser.add_argument("--llm-deny", type=float, default=0.05, help="доля ответов-отказов")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="переопределить любой параметр config")
+    parser.add_argument("--keep", action="store_true", help="не удалять рабочую папку")
+    parser.add_argument("--serve-ace", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_ace:
+        serve_ace(args.serve_ace, args.ace_delay, args.track, args.ace_fixed)
+        return 0
+
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    prepare_workdir(workdir)
+    os.chdir(workdir)
+    try:
+        return run(args)
+    finally:
+        os.chdir(REPO_DIR)
+        if args.keep: print(f"📁 Рабочая папка: {workdir}")
+        else: shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
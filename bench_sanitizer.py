@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+bench_sanitizer.py — старая очистка ответов LLM (super_clean + перечитывание denials.txt и
+any(d in text.lower() ...) на каждый ответ) против text_sanitizer. Гоняет синтетические ответы
+"думающих" моделей: длинные <think>-блоки, метки End of Thought, префиксы, примечания.
+Проверяет, что результат очистки и вердикт по отказам совпадают, и печатает время.
+Запуск: python3 bench_sanitizer.py [размер рассуждений в КБ, через запятую]
+"""
+import os
+import re
+import sys
+import time
+import random
+import text_sanitizer as ts
+import live_config
+from config import *
+
+# --- Старая реализация (как было в lyrics_manager) ---
+
+LEGACY_END_OF_THOUGHT = re.compile(r"(?s).*?End of Thought\s*\(\*?\d+(?:\.\d+)?s?\)\s*", flags=re.IGNORECASE)
+LEGACY_THINK = re.compile(r"<think>.*?</think>", flags=re.DOTALL | re.IGNORECASE)
+
+def legacy_super_clean(text):
+    if not text: return ""
+    text = LEGACY_THINK.sub("", text)
+    text = LEGACY_END_OF_THOUGHT.sub("", text)
+    text = re.sub(r"(?is)\n?\s*(?:---|\*\*\*|___)?\s*(?:Примечание|Note|P\.S\.)[:\s].*$", "", text)
+    text = re.sub(r"```[a-zA-Z]*\n?(.*?)\n?```", r"\1", text, flags=re.DOTALL)
+    text = re.sub(r"\*\*(.*?)\*\*", r"\1", text)
+    text = text.strip().strip('"').strip('«').strip('»').strip("'")
+    changed = True
+    while changed:
+        changed = False
+        for prefix in ts.PREFIXES:
+            if text.lower().startswith(prefix.lower()):
+                text = text[len(prefix):].strip().strip(":").strip()
+                changed = True
+    return text
+
+def legacy_load_denials():
+    d_list = list(ts.DEFAULT_DENIALS)
+    if os.path.exists(DENIALS_FILE):
+        with open(DENIALS_FILE, "r", encoding="utf-8") as f:
+            for line in f:
+                p = line.strip().lower()
+                if p and not p.startswith("#"): d_list.append(p)
+    return list(set(d_list))
+
+def legacy_check(raw):
+    denials = legacy_load_denials()   # раньше — на каждый вызов get_text_from_llm
+    text = legacy_super_clean(raw)
+    return text, any(d in text.lower() for d in denials)
+
+def new_check(raw):
+    text = ts.super_clean(raw)
+    return text, live_config.get_denials().search(text) is not None
+
+# --- Синтетические ответы ---
+
+WORDS = ("let me think about the rhythm and the rhyme scheme first then the chorus should hit hard "
+         "нужно подобрать рифму к слову ночь и сделать припев громче чтобы качало").split()
+LINES = ["Огни ночного города горят", "Мы танцуем до утра опять", "Baby, turn the music up",
+         "Сердце бьется в такт басам", "Никто не спит, никто не ждет"]
+
+def reasoning(kb, rng):
+    out, size = [], 0
+    while size < kb * 1024:
+        w = rng.choice(WORDS)
+        out.append(w)
+        size += len(w) + 1
+    return " ".join(out)
+
+def make_samples(kb, rng):
+    body = "\n".join(rng.choice(LINES) for _ in range(16))
+    think = reasoning(kb, rng)
+    return {
+        "think-блок": f"<think>{think}</think>\n\nLyrics: **Куплет**\n{body}",
+        "End of Thought": f"{think}\nEnd of Thought (12.4s)\n\nHere is: Title: Ночь\n{body}\n\n---\nПримечание: текст можно доработать.",
+        "без метки": f"Sure, {think}\n```\n{body}\n```",
+        "отказ": f"<think>{think}</think>\nИзвините, я не могу написать такой текст.",
+    }
+
+def bench(fn, raw, min_time=0.2):
+    n, start = 0, time.perf_counter()
+    while True:
+        fn(raw)
+        n += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time: return elapsed / n
+
+def main():
+    sizes = [int(x) for x in sys.argv[1].split(",")] if len(sys.argv) > 1 else [2, 8, 32]
+    rng = random.Random(1)
+    ok = True
+    print(f"{'ОТВЕТ':<16} {'КБ':>4} {'СТАРАЯ, мс':>11} {'НОВАЯ, мс':>10} {'УСКОРЕНИЕ':>10}")
+    for kb in sizes:
+        for name, raw in make_samples(kb, rng).items():
+            old, new = legacy_check(raw), new_check(raw)
+            if old != new:
+                ok = False
+                print(f"⚠️ {name} {kb}КБ: результаты расходятся\n  старая: {old!r:.200}\n  новая:  {new!r:.200}")
+            t_old, t_new = bench(legacy_check, raw), bench(new_check, raw)
+            print(f"{name:<16} {kb:>4} {t_old * 1000:>11.3f} {t_new * 1000:>10.3f} {t_old / t_new:>9.1f}x")
+    print("✅ Очистка и отказы совпадают со старой реализацией" if ok else "❌ Есть расхождения со старой реализацией")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,33 +4,78 @@ os.environ["TQDM_DISABLE"] = "1"
 
 # ФАЙЛЫ
 PROMPT_CAPTION_FILE = "prompt_caption.txt"
+PROMPT_CAPTION_TASK_FILE = "prompt_caption_task.txt"
 PROMPT_LYRICS_FILE = "prompt_lyrics.txt"
 DENIALS_FILE = "denials.txt"
 PROVIDERS_FILE = "providers_list.txt"
-INACTIVE_FILE = "inactive_providers.json"
-SUNG_HISTORY_FILE = "sung_songs.json"
+PROVIDER_STATS_FILE = "provider_stats.json"
+SUNG_HISTORY_FILE = "sung_songs.json"      # старый формат, переносится в журнал при первом запуске
+SUNG_JOURNAL_FILE = "sung_songs.jsonl"
 COLLECTED_LYRICS_FILE = "collected_lyrics.txt"
 MONSTER_STATE_FILE = "monster_state.json"
 ALBUM_META_FILE = "current_metadata.json"
+TEXT_SPOOL_FILE = "text_spool.sqlite3"
+LYRICS_INDEX_FILE = "collected_lyrics.idx.json"
+SCHEDULER_STATE_FILE = "song_scheduler.json"
+UPLOAD_QUEUE_FILE = "upload_queue.sqlite3"
+CONFIG_CHECK_INTERVAL = 5          # как часто сверять промпты, providers_list.txt и denials.txt с диском (сек)
 
 # ПАПКИ
 ALBUMS_DIR = "completed_albums"
 BASE_TEMP_DIR = "all_segments_history"
+ACE_CACHE_DIR = "ace_cache"  # GRADIO_TEMP_DIR запущенных нами экземпляров ACE
 
 # ПАРАМЕТРЫ СЕРВЕРА
 ACE_API_URL = "http://127.0.0.1:7860/"
 MODEL_CONFIG = "acestep-v15-turbo"
 LM_MODEL = "acestep-5Hz-lm-1.7B"
+ACE_INSTANCES = 1           # сколько процессов ACE держать одновременно (экземпляр 0 — на ACE_API_URL)
+ACE_BASE_PORT = 7860        # экземпляр i слушает ACE_BASE_PORT + i
+ACE_STARTUP_TIMEOUT = 300   # общий дедлайн на подъем сервера и инициализацию модели после запуска процесса
+ACE_READY_MARKER = "Running on local URL"  # строка в логах acestep, после которой сервер принимает запросы
+ACE_CACHE_MAX_AGE = 60 * 60  # janitor удаляет из кэша Gradio файлы старше этого (сек)
+ACE_INSTANCE_CPUS = []      # необязательно: наборы ядер по экземплярам, например [[0, 1, 2, 3], [4, 5, 6, 7]]
+ACE_THREADS = 0             # OMP/MKL-потоков на экземпляр ACE: 0 — по числу его ядер (если заданы), иначе как решит torch
+
+# ПАРАМЕТРЫ LLM
+LLM_MAX_ATTEMPTS = 50       # сколько всего запросов к провайдерам на один текст
+LLM_HEDGE_FANOUT = 3        # сколько запросов к разным провайдерам может идти одновременно
+LLM_HEDGE_DELAY = 10        # через сколько секунд без ответа запускать запасной запрос (0 — сразу веером)
+LLM_REQUEST_TIMEOUT = 120   # таймаут одного запроса к провайдеру
+TEXT_WORKERS = 2            # сколько воркеров текстов работают параллельно
+TEXT_QUEUE_SIZE = 15        # сколько готовых пар caption/lyrics держим в запасе
+PROVIDER_STATS_FLUSH_SECONDS = 60  # как часто сбрасывать табло провайдеров на диск
+SCHEDULER_POLICY = "shuffle"  # порядок песен-образцов: "shuffle", "artist" (исполнители по кругу) или "order" (как в файле)
+
+# МЕТРИКИ
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108         # эндпоинт Prometheus http://METRICS_HOST:METRICS_PORT/metrics (0 — выключен)
+METRICS_JSONL_FILE = ""     # если задан, каждое наблюдение дописывается сюда строкой JSON
 
 # ПАРАМЕТРЫ ГЕНЕРАЦИИ
 TARGET_TOTAL_SECONDS = 60 * 60
 TRACK_DURATION = 90
 CROSSFADE_DURATION = 15
+ACE_BATCH_SIZE = 1           # сегментов (дублей одного текста) за один вызов ACE; дубли идут подряд в одной тональности. Подобрать через bench_batch.py
+AUDIO_ENGINE = "sox"         # "numpy" — pitch rise и кроссфейд в процессе (dsp_engine.py), без sox/ffmpeg
+FINAL_ENCODE_JOBS = 0        # финальный AAC кодируется кусками параллельно: 0 — по MEDIA_JOBS, 1 — одним процессом
 ALBUMS_TO_GENERATE = 325
+ALBUMS_IN_PARALLEL = 1       # сколько альбомов генерируются одновременно (рендер и отправка идут в фоне сверх этого)
 MONSTER_COOLDOWN = 24 * 60 * 60 
 
 MUSIC_KEYS = ["Am", "A#m", "Bm", "Cm", "C#m", "Dm", "D#m", "Em", "Fm", "F#m", "Gm", "G#m"]
 
+# ОБРАБОТКА ЗВУКА (sox/ffmpeg через media_jobs.py; разбиение ядер подбирает autotune_cpus.py)
+MEDIA_JOBS = 0               # сколько sox/ffmpeg одновременно: 0 — по числу ядер MEDIA_CPUS (или всех ядер)
+MEDIA_JOB_TIMEOUT = 30 * 60  # таймаут одного вызова sox/ffmpeg (сек)
+MEDIA_CPUS = []              # ядра под sox/ffmpeg, например [6, 7]; ACE без ACE_INSTANCE_CPUS получает остальные
+
+# ОТПРАВКА
+UPLOAD_CONCURRENCY = 2       # сколько альбомов отправляются одновременно
+UPLOAD_MAX_ATTEMPTS = 8      # после стольких неудач альбом помечается failed (файл остается в ALBUMS_DIR)
+UPLOAD_RETRY_BASE = 30       # пауза перед первым повтором, дальше удваивается (сек)
+UPLOAD_DRAIN_TIMEOUT = 30 * 60  # сколько при остановке ждать отправки оставшихся альбомов
+
 # TELEGRAM
 API_ID = апиайди
 API_HASH = 'апихэш'
@@ -0,0 +1,123 @@
+import os
+import shutil
+import logging
+from config import *
+
+logger = logging.getLogger(__name__)
+
+# Необязательный движок: без numpy/soundfile просто остаемся на sox/ffmpeg
+try:
+    import numpy as np
+    import soundfile as sf
+    AVAILABLE = True
+except ImportError:
+    np = sf = None
+    AVAILABLE = False
+
+N_FFT = 2048
+HOP = N_FFT // 4
+
+def load(path):
+    """Декодируем один раз в float32 [сэмплы, каналы] + sample rate + субтип (битность) исходника."""
+    data, sr = sf.read(path, dtype="float32", always_2d=True)
+    return data, sr, sf.info(path).subtype
+
+def save(path, data, sr, subtype="PCM_16"):
+    sf.write(path, np.clip(data, -1.0, 1.0), sr, subtype=subtype, format="FLAC")
+
+# --- Фазовый вокодер ---
+
+def _stft(x):
+    window = np.hanning(N_FFT + 1)[:-1].astype(np.float32)
+    xp = np.pad(x, (N_FFT // 2, N_FFT // 2 + HOP))
+    frames = np.lib.stride_tricks.sliding_window_view(xp, N_FFT)[::HOP]
+    return np.fft.rfft(frames * window, axis=1).T, window
+
+def _istft(spec, window, length):
+    frames = np.fft.irfft(spec.T, n=N_FFT, axis=1) * window
+    k = frames.shape[0]
+    out = np.zeros((k + N_FFT // HOP) * HOP, dtype=np.float64)
+    norm = np.zeros_like(out)
+    wsq = np.tile(window ** 2, (k, 1))
+    # Overlap-add без цикла по кадрам: j-й блок каждого кадра ложится в out со сдвигом j*HOP
+    for j in range(N_FFT // HOP):
+        block = slice(j * HOP, (j + 1) * HOP)
+        out[j * HOP:j * HOP + k * HOP] += frames[:, block].reshape(-1)
+        norm[j * HOP:j * HOP + k * HOP] += wsq[:, block].reshape(-1)
+    out /= np.maximum(norm, 1e-8)
+    return out[N_FFT // 2:N_FFT // 2 + length]
+
+def _stretch(x, steps):
+    """Растяжение во времени без смены высоты: steps — дробные позиции анализа (в кадрах) для каждого кадра синтеза."""
+    spec, window = _stft(x)
+    n = spec.shape[1]
+    steps = np.clip(steps, 0, n - 2)
+    i = steps.astype(np.int64)
+    frac = (steps - i)[None, :]
+
+    mag = np.abs(spec)
+    phase = np.angle(spec)
+    omega = (2 * np.pi * HOP * np.arange(spec.shape[0]) / N_FFT).astype(np.float32)
+    dphi = phase[:, 1:] - phase[:, :-1] - omega[:, None]
+    dphi = dphi - 2 * np.pi * np.round(dphi / (2 * np.pi)) + omega[:, None]
+
+    out_mag = (1 - frac) * mag[:, i] + frac * mag[:, i + 1]
+    # Фаза накапливается по кадрам синтеза: cumsum вместо питоновского цикла
+    acc = np.cumsum(dphi[:, i], axis=1, dtype=np.float64)
+    out_phase = phase[:, :1] + np.concatenate([np.zeros((spec.shape[0], 1)), acc[:, :-1]], axis=1)
+    return out_mag * np.exp(1j * out_phase), window
+
+def pitch_bend(data, sr, cents, bend_duration, total_duration):
+    """
+    Аналог `sox bend 0,<cents>,<bend_duration> trim 0 <total_duration>`: высота плавно уходит
+    на cents за bend_duration сек и дальше держится, темп не меняется.
+    Делаем так: растягиваем фазовым вокодером по карте времени, затем векторно ресэмплим
+    с переменной скоростью 2^(c(t)/1200) — ресэмплинг сдвигает высоту и возвращает исходный темп.
+    """
+    total = min(len(data), int(round(total_duration * sr)))
+    t = np.arange(total, dtype=np.float64)
+    c = cents * np.minimum(t / max(bend_duration * sr, 1), 1.0)
+    rate = 2.0 ** (c / 1200.0)
+    phi = np.concatenate([[0.0], np.cumsum(rate)[:-1]])   # позиция чтения в растянутом сигнале
+
+    # Кадру синтеза на позиции u нужен исходный звук из момента phi^-1(u)
+    n_frames = int(np.ceil((phi[-1] + 1) / HOP)) + 1
+    u = np.arange(n_frames) * HOP
+    steps = np.interp(u, phi, t) / HOP
+
+    out = np.empty((total, data.shape[1]), dtype=np.float32)
+    for ch in range(data.shape[1]):
+        spec, window = _stretch(data[:, ch], steps)
+        z = _istft(spec, window, n_frames * HOP)
+        out[:, ch] = np.interp(phi, np.arange(len(z)), z)
+    return out
+
+# --- Кроссфейд ---
+
+def crossfade(a, b, n):
+    """Как ffmpeg acrossfade c1=tri:c2=tri на n сэмплах: линейные кривые i/n и (n-1-i)/n."""
+    i = np.arange(n, dtype=np.float32)[:, None]
+    mixed = a[-n:] * ((n - 1 - i) / n) + b[:n] * (i / n)
+    return np.concatenate([a[:-n], mixed, b[n:]])
+
+# --- Замены для audio_utils ---
+
+def apply_pitch_rise(input_path, output_path, total_duration, crossfade_duration):
+    end_time = total_duration - crossfade_duration
+    if end_time <= 5:
+        shutil.copy(input_path, output_path)
+        return True
+    data, sr, subtype = load(input_path)
+    save(output_path, pitch_bend(data, sr, -100, end_time, total_duration), sr, subtype)
+    return os.path.exists(output_path) and os.path.getsize(output_path) > 1000
+
+def render_step(segment_path, prev_tail, chunk_path, tail_path, crossfade_duration=CROSSFADE_DURATION):
+    seg, sr, subtype = load(segment_path)
+    n = int(crossfade_duration * sr)
+    if len(seg) - n <= 0:
+        raise ValueError(f"Сегмент {segment_path} короче кроссфейда")
+    if prev_tail:
+        tail, _, _ = load(prev_tail)
+        seg = crossfade(tail, seg, n)
+    save(chunk_path, seg[:-n], sr, subtype)
+    save(tail_path, seg[-n:], sr, subtype)
@@ -0,0 +1,129 @@
+import os
+import time
+import logging
+import threading
+import text_sanitizer
+from config import *
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAPTION_SYSTEM = "Act as an RnB producer."
+DEFAULT_CAPTION_TASK = "Describe a professional house pop hit."
+DEFAULT_LYRICS_SYSTEM = "Act as a viral pop-star writer."
+
+class CachedFile:
+    """
+    Файл, разобранный parse(text) (text=None — файла нет). Читается один раз; дальше get() не чаще раза
+    в CONFIG_CHECK_INTERVAL сек делает stat() и перечитывает файл, только если сменились mtime, размер или inode.
+    Если новая версия не разобралась, остается прошлое значение — правка вступит в силу, когда файл починят.
+    """
+
+    def __init__(self, path, parse, check_interval=CONFIG_CHECK_INTERVAL):
+        self.path = path
+        self.parse = parse
+        self.check_interval = check_interval
+        self.value = None
+        self.stamp = self.checked = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.checked is not None and now - self.checked < self.check_interval:
+                return self.value
+            self.checked = now
+            stamp = self._stamp()
+            if self.stamp is None or stamp != self.stamp:
+                self._reload(stamp)
+            return self.value
+
+    def _stamp(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size, st.st_ino)
+        except FileNotFoundError:
+            return ()
+
+    def _reload(self, stamp):
+        try:
+            text = None
+            if stamp:
+                with open(self.path, "r", encoding="utf-8") as f: text = f.read()
+            value = self.parse(text)
+        except Exception as e:
+            if self.stamp is None: raise
+            logger.warning(f"⚠️ {self.path} не разобрался, оставляю прошлую версию: {e}")
+            return
+        if self.stamp is not None:
+            logger.info(f"♻️ {self.path} изменился — подхватил без рестарта")
+        self.value, self.stamp = value, stamp
+
+_files = {}
+_files_lock = threading.Lock()
+
+def cached(path, parse):
+    """Один CachedFile на путь и разборщик на весь процесс."""
+    key = (path, parse)
+    with _files_lock:
+        if key not in _files: _files[key] = CachedFile(path, parse)
+        return _files[key]
+
+# --- Промпты ---
+
+_prompts = {}
+
+def get_prompt(path, default):
+    """Текст промпта без пробелов по краям; файла нет или он пуст — default."""
+    with _files_lock:
+        if (path, default) not in _prompts:
+            _prompts[path, default] = CachedFile(path, lambda text: (text or "").strip() or default)
+        entry = _prompts[path, default]
+    return entry.get()
+
+def get_prompts():
+    """(системный промпт caption, задача caption, системный промпт lyrics) — текущие версии файлов."""
+    return (
+        get_prompt(PROMPT_CAPTION_FILE, DEFAULT_CAPTION_SYSTEM),
+        get_prompt(PROMPT_CAPTION_TASK_FILE, DEFAULT_CAPTION_TASK),
+        get_prompt(PROMPT_LYRICS_FILE, DEFAULT_LYRICS_SYSTEM),
+    )
+
+# --- Провайдеры ---
+
+def parse_providers(text):
+    """
+    "Provider: model1, model2" на строку, # — комментарий. Неверные строки пропускаются с предупреждением,
+    повторы провайдера сливаются. Результат общий для всех вызывающих — не менять.
+    """
+    providers, by_name = [], {}
+    for n, line in enumerate((text or "").splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"): continue
+        p_name, sep, models = line.partition(":")
+        p_name = p_name.strip()
+        models = [m.strip() for m in models.split(",") if m.strip()]
+        if not sep or not p_name or not models:
+            logger.warning(f"⚠️ {PROVIDERS_FILE}:{n}: ожидалось 'Provider: model1, model2', пропускаю: {line[:80]}")
+            continue
+        if p_name in by_name:
+            by_name[p_name]["models"].extend(m for m in models if m not in by_name[p_name]["models"])
+            continue
+        by_name[p_name] = {"provider": p_name, "models": models}
+        providers.append(by_name[p_name])
+    if not providers:
+        logger.warning(f"⚠️ В {PROVIDERS_FILE} нет ни одного провайдера")
+    return providers
+
+def get_providers():
+    return cached(PROVIDERS_FILE, parse_providers).get()
+
+# --- Отказы ---
+
+def parse_denials(text):
+    matcher = text_sanitizer.DenialMatcher(text_sanitizer.parse_denials((text or "").splitlines()))
+    logger.info(f"🧱 Матчер отказов собран: {len(matcher.phrases)} фраз")
+    return matcher
+
+def get_denials(path=DENIALS_FILE):
+    """Скомпилированный матчер отказов (DenialMatcher) для текущей версии denials.txt."""
+    return cached(path, parse_denials).get()
@@ -0,0 +1,270 @@
+import os
+import re
+import json
+import mmap
+import zlib
+import logging
+import random
+from array import array
+from config import *
+
+logger = logging.getLogger(__name__)
+
+# Тот же формат записи, что и раньше, но по байтам — регэксп гоняется прямо по mmap.
+# \r?\n — потому что раньше файл читался в текстовом режиме с универсальными переводами строк
+RE_SONG = re.compile(rb"ID:\s*(.*?)\r?\nADDED:.*?\r?\n={30,}\r?\n\r?\n(.*?)(?=\r?\n={30,}|$)", re.DOTALL)
+INDEX_FORMAT = 2
+HEAD_PROBE = 4096
+
+class LyricsIndex:
+    """
+    Индекс базы текстов: для каждой песни храним байтовые смещения (заголовок, начало и конец текста).
+    Сам индекс лежит рядом с базой, сверяется по mtime/size и при росте файла
+    дочитывает только хвост. Тексты песен достаются лениво через mmap.
+    На диске — маленький заголовок (index_path) и файл записей по строке на песню (.entries):
+    при дочитке в него дописываются только новые записи, заголовок переписывается последним.
+    """
+
+    def __init__(self, path=COLLECTED_LYRICS_FILE, index_path=LYRICS_INDEX_FILE):
+        self.path = path
+        self.index_path = index_path
+        self.entries_path = f"{os.path.splitext(index_path)[0]}.entries"
+        self._line_starts = array("Q", [0])   # байтовые начала записей в файле записей (+ конец последней)
+        self.entries = []   # [id, header_start, body_start, body_end]
+        self.by_id = {}     # id -> позиция в entries (первое вхождение)
+        self.size = 0
+        self.mtime = 0
+        self.head_crc = 0
+        self.version = 0    # растет при каждом изменении индекса
+        self.rebuilds = 0   # растет только при полной перестройке (при дочитке старые записи не меняются)
+        self._fh = None
+        self._mm = None
+        self._load_index()
+
+    # --- Публичное API ---
+
+    def __len__(self):
+        return len(self.entries)
+
+    def ids(self):
+        return [e[0] for e in self.entries]
+
+    def id_at(self, pos):
+        return self.entries[pos][0]
+
+    def lyrics_at(self, pos):
+        _, _, start, end = self.entries[pos]
+        mm = self._map()
+        if mm is None: return ""
+        text = mm[start:end].decode("utf-8", errors="replace")
+        return text.replace("\r\n", "\n").replace("\r", "\n").strip()
+
+    def get_lyrics(self, song_id):
+        pos = self.by_id.get(song_id)
+        return None if pos is None else self.lyrics_at(pos)
+
+    def refresh(self):
+        """Дешевая проверка через stat(); при изменении файла — дочитываем хвост или строим заново."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            if self.entries or self.size:
+                self._reset()
+                self.rebuilds += 1
+                self._bump()
+            return self
+
+        if st.st_size == self.size and st.st_mtime_ns == self.mtime:
+            return self
+
+        self._close()
+        mm = self._map()
+        if mm is not None and st.st_size > self.size and self._prefix_intact(mm):
+            # Файл дописали: последняя песня могла удлиниться, поэтому пересканируем с ее заголовка
+            start = self.entries[-1][1] if self.entries else 0
+            if self.entries:
+                last_id = self.entries.pop()[0]
+                if self.by_id.get(last_id) == len(self.entries): del self.by_id[last_id]
+            keep = len(self.entries)
+            added = self._scan(mm, start)
+            logger.info(f"📚 Индекс текстов дочитан: +{added} песен (всего {len(self.entries)})")
+        else:
+            self.entries, self.by_id = [], {}
+            keep = 0
+            self.rebuilds += 1
+            if mm is not None: self._scan(mm, 0)
+            logger.info(f"📚 Индекс текстов перестроен: {len(self.entries)} песен")
+
+        self.size, self.mtime = st.st_size, st.st_mtime_ns
+        self.head_crc = self._head_crc(mm, min(self.size, HEAD_PROBE))
+        self._bump()
+        self._save_index(keep)
+        return self
+
+    def close(self):
+        self._close()
+
+    # --- Внутренности ---
+
+    def _bump(self):
+        self.version += 1
+
+    def _reset(self):
+        self._close()
+        self.entries, self.by_id = [], {}
+        self.size = self.mtime = self.head_crc = 0
+
+    def _map(self):
+        if self._mm is not None: return self._mm
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0: return None
+        self._fh = open(self.path, "rb")
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm
+
+    def _close(self):
+        if self._mm is not None: self._mm.close()
+        if self._fh is not None: self._fh.close()
+        self._mm = self._fh = None
+
+    def _scan(self, mm, start):
+        added = 0
+        for m in RE_SONG.finditer(mm, start):
+            song_id = m.group(1).decode("utf-8", errors="replace").strip()
+            self.by_id.setdefault(song_id, len(self.entries))
+            self.entries.append([song_id, m.start(), m.start(2), m.end(2)])
+            added += 1
+        return added
+
+    def _head_crc(self, mm, length=HEAD_PROBE):
+        return zlib.crc32(mm[:length]) if mm is not None else 0
+
+    def _prefix_intact(self, mm):
+        # Начало файла и заголовок последней песни должны остаться на месте, иначе файл переписан
+        if self.size == 0: return True
+        if self._head_crc(mm, min(self.size, HEAD_PROBE)) != self.head_crc: return False
+        if self.entries and mm[self.entries[-1][1]:self.entries[-1][1] + 3] != b"ID:": return False
+        return True
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path): return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f: head = json.load(f)
+            if head.get("format") != INDEX_FORMAT: return
+            # Заголовок пишется последним: в файле записей верим только первым entries_bytes байтам
+            with open(self.entries_path, "rb") as f: data = f.read(head["entries_bytes"])
+            if len(data) != head["entries_bytes"]: raise ValueError("файл записей короче заголовка")
+            entries, starts = [], array("Q", [0])
+            for line in data.splitlines(keepends=True):
+                entries.append(json.loads(line))
+                starts.append(starts[-1] + len(line))
+            if len(entries) != head["count"]: raise ValueError("число записей не совпадает с заголовком")
+            self.entries, self._line_starts = entries, starts
+            self.size, self.mtime, self.head_crc = head["size"], head["mtime"], head["head_crc"]
+            self.by_id = {}
+            for pos, e in enumerate(self.entries): self.by_id.setdefault(e[0], pos)
+            self._bump()
+        except Exception as e:
+            print(f"⚠️ Индекс текстов поврежден, будет перестроен: {e}")
+            self.entries, self.by_id, self._line_starts = [], {}, array("Q", [0])
+            self.size = self.mtime = self.head_crc = 0
+
+    def _save_index(self, keep=0):
+        """Первые keep записей уже лежат в файле записей — дописываем остальные с их места, затем заголовок."""
+        try:
+            keep = min(keep, len(self._line_starts) - 1) if os.path.exists(self.entries_path) else 0
+            with open(self.entries_path, "r+b" if keep else "wb") as f:
+                f.seek(self._line_starts[keep])
+                f.truncate()
+                del self._line_starts[keep + 1:]
+                pos = self._line_starts[keep]
+                for e in self.entries[keep:]:
+                    line = (json.dumps(e, ensure_ascii=False) + "\n").encode("utf-8")
+                    f.write(line)
+                    pos += len(line)
+                    self._line_starts.append(pos)
+            head = {"format": INDEX_FORMAT, "size": self.size, "mtime": self.mtime, "head_crc": self.head_crc,
+                    "count": len(self.entries), "entries_bytes": pos}
+            tmp = f"{self.index_path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f: json.dump(head, f)
+            os.replace(tmp, self.index_path)
+        except Exception as e:
+            print(f"⚠️ Не удалось сохранить индекс текстов: {e}")
+            self._line_starts = array("Q", [0])
+
+
+def is_content_line(line):
+    # Пустые строки и теги секций вида [Chorus] в миксы не берем
+    return bool(line.strip()) and not (line.startswith('[') and line.endswith(']'))
+
+class LinePool:
+    """
+    Компактный пул строк для синтетических миксов: строки каждой песни лежат в своей строке-блобе,
+    границы строк — в сквозном массиве смещений. Строится один раз на версию индекса, при дочитке
+    базы пересобирается только последняя песня и новые — старые блобы не копируются. Выборка k строк стоит O(k).
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.blobs = []                  # строки песни s подряд, каждая с \n на конце
+        self.offsets = array("Q", [0])   # сквозные границы строк: строка i занимает [offsets[i], offsets[i+1]-1)
+        self.line_song = array("I")      # номер песни для строки i
+        self.song_starts = array("Q")    # номер первой строки каждой песни
+        self.version = None
+        self.rebuilds = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def line(self, i):
+        s = self.line_song[i]
+        base = self.offsets[self.song_starts[s]]
+        return self.blobs[s][self.offsets[i] - base:self.offsets[i + 1] - base - 1]
+
+    def sync(self):
+        index = self.index
+        if self.version == index.version: return self
+        if self.rebuilds == index.rebuilds and len(self.song_starts) > 0:
+            # Индекс только дочитывался: последняя песня могла измениться, остальные — нет
+            keep = len(self.song_starts) - 1
+            cut = self.song_starts[keep]
+            del self.blobs[keep:]
+            del self.offsets[cut + 1:]
+            del self.line_song[cut:]
+            del self.song_starts[keep:]
+        else:
+            self.blobs, self.offsets, self.line_song, self.song_starts = [], array("Q", [0]), array("I"), array("Q")
+            keep = 0
+
+        pos = self.offsets[-1]
+        for song_pos in range(keep, len(index)):
+            song = len(self.blobs)
+            self.song_starts.append(len(self.offsets) - 1)
+            parts = []
+            for l in index.lyrics_at(song_pos).split('\n'):
+                if not is_content_line(l): continue
+                l = l.strip() + "\n"
+                parts.append(l)
+                pos += len(l)
+                self.offsets.append(pos)
+                self.line_song.append(song)
+            self.blobs.append("".join(parts))
+        self.version, self.rebuilds = index.version, index.rebuilds
+        return self
+
+    def sample(self, k, exclude=None, max_tries=None):
+        """k случайных различных строк; exclude — множество строк, которые брать нельзя (например, уже спетые в альбоме)."""
+        n = len(self)
+        if n == 0: return []
+        k = min(k, n)
+        if not exclude:
+            return [self.line(i) for i in random.sample(range(n), k)]
+        picked, seen = [], set()
+        tries = max_tries or k * 20
+        while len(picked) < k and tries > 0:
+            tries -= 1
+            i = random.randrange(n)
+            if i in seen: continue
+            seen.add(i)
+            l = self.line(i)
+            if l not in exclude: picked.append(l)
+        return picked
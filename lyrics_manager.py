@@ -1,202 +1,244 @@
-import os
-import json
-import random
-import re
 import time
 import logging
 import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import g4f
+import metrics
+import text_sanitizer
+import live_config
 from config import *
+from lyrics_index import LyricsIndex, LinePool
+from provider_scoreboard import ProviderScoreboard
+from sung_history import SungHistory
 
 logger = logging.getLogger(__name__)
 
-RE_END_OF_THOUGHT = re.compile(r"(?s).*?End of Thought\s*\(\*?\d+(?:\.\d+)?s?\)\s*", flags=re.IGNORECASE)
-RE_THINK = re.compile(r"<think>.*?</think>", flags=re.DOTALL | re.IGNORECASE)
-INACTIVE_SECONDS = 10 * 60
-
-def super_clean(text):
-    if not text: return ""
-    
-    # 1. Удаляем <think> блоки
-    text = RE_THINK.sub("", text)
-    
-    # 2. Удаляем ВЕСЬ блок рассуждений в начале (до метки End of Thought)
-    text = RE_END_OF_THOUGHT.sub("", text)
-    
-    # 3. НОВОЕ: Удаляем "Примечание", "Note" и всё, что после них до конца текста
-    # Ищет варианты: "Примечание:", "--- Примечание", "**Примечание**" и т.д.
-    text = re.sub(r"(?is)\n?\s*(?:---|\*\*\*|___)?\s*(?:Примечание|Note|P\.S\.)[:\s].*$", "", text)
-    
-    # 4. Чистим Markdown блоки кода ```...```
-    text = re.sub(r"```[a-zA-Z]*\n?(.*?)\n?```", r"\1", text, flags=re.DOTALL)
-    
-    # 5. Удаляем жирное выделение **...**
-    text = re.sub(r"\*\*(.*?)\*\*", r"\1", text)
-    
-    # 6. Базовая очистка краев
-    text = text.strip().strip('"').strip('«').strip('»').strip("'")
-    
-    # 7. Очистка мусорных префиксов в начале
-    prefixes = [
-        "Prompt:", "Lyrics:", "Response:", "Here is", "Sure,", "I will",
-        "Название:", "Название песни:", "Title:", "Текст песни:", "Отредактированный текст:"
-    ]
-    
-    changed = True
-    while changed:
-        changed = False
-        for prefix in prefixes:
-            if text.lower().startswith(prefix.lower()):
-                text = text[len(prefix):].strip().strip(":").strip()
-                changed = True
-                
-    return text
+# Очистка и поиск отказов живут в text_sanitizer; имя super_clean оставлено для совместимости
+super_clean = text_sanitizer.super_clean
     
+# Промпты, провайдеры и отказы читаются через live_config: с диска — только когда файл изменился
 def load_prompt(file_path, default):
-    if os.path.exists(file_path):
-        with open(file_path, "r", encoding="utf-8") as f: return f.read().strip()
-    return default
+    return live_config.get_prompt(file_path, default)
 
 def load_denials():
-    d_list = ["as an ai", "i cannot", "unauthorized", "explicit", "offensive", "policy"]
-    if os.path.exists(DENIALS_FILE):
-        with open(DENIALS_FILE, "r", encoding="utf-8") as f:
-            for line in f:
-                p = line.strip().lower()
-                if p and not p.startswith("#"): d_list.append(p)
-    return list(set(d_list))
+    return sorted(live_config.get_denials().phrases)
 
 def load_providers():
-    providers = []
-    if os.path.exists(PROVIDERS_FILE):
-        with open(PROVIDERS_FILE, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith("#"):
-                    try:
-                        p_name, models = line.split(":", 1)
-                        providers.append({"provider": p_name.strip(), "models": [m.strip() for m in models.split(",")]})
-                    except: continue
-    return providers
-
-def load_inactive():
-    if not os.path.exists(INACTIVE_FILE): return {}
-    try:
-        with open(INACTIVE_FILE, "r") as f: return json.load(f)
-    except: return {}
+    return live_config.get_providers()
+
+# Табло провайдеров: статистика и баны живут в памяти, на диск — периодически и при остановке
+scoreboard = ProviderScoreboard()
+
+def record_outcome(p_name, model, outcome, latency=None):
+    """Итог одного запроса — в табло провайдеров и в метрики."""
+    scoreboard.record(p_name, model, outcome, latency)
+    if latency is None:
+        # Запроса не было — нулевая задержка исказила бы гистограмму
+        metrics.LLM_OUTCOMES_NO_LATENCY.inc(provider=p_name, model=model, outcome=outcome)
+    else:
+        metrics.LLM_REQUEST_SECONDS.observe(latency, provider=p_name, model=model, outcome=outcome)
+
+def mark_inactive(p_name, model=None, outcome="error", latency=None):
+    if model is not None: record_outcome(p_name, model, outcome, latency)
+    scoreboard.cooldown(p_name)
+    print(f"🚫 Провайдер {p_name} забанен на 10 мин.")
 
-def save_inactive(data):
-    with open(INACTIVE_FILE, "w") as f: json.dump(data, f)
+_lyrics_index = None
 
-def is_provider_active(p_name, inactive_map):
-    until = inactive_map.get(p_name)
-    if not until or time.time() > until: return True
-    return False
-
-def mark_inactive(p_name):
-    m = load_inactive()
-    m[p_name] = time.time() + INACTIVE_SECONDS
-    save_inactive(m)
-    print(f"🚫 Провайдер {p_name} забанен на 10 мин.")
+def get_lyrics_index():
+    """Общий индекс базы текстов; каждый вызов — только stat() и, при росте файла, дочитка хвоста."""
+    global _lyrics_index
+    if _lyrics_index is None:
+        _lyrics_index = LyricsIndex()
+    return _lyrics_index.refresh()
 
 def parse_lyrics_database():
-    if not os.path.exists(COLLECTED_LYRICS_FILE): return []
-    with open(COLLECTED_LYRICS_FILE, "r", encoding="utf-8") as f: content = f.read()
-    pattern = re.compile(r"ID:\s*(.*?)\nADDED:.*?\n={30,}\n\n(.*?)(?=\n={30,}|$)", re.DOTALL)
-    return [{"id": m[0].strip(), "lyrics": m[1].strip()} for m in pattern.findall(content)]
+    # Совместимость: полный список песен, собранный из индекса
+    index = get_lyrics_index()
+    return [{"id": index.id_at(i), "lyrics": index.lyrics_at(i)} for i in range(len(index))]
+
+_line_pool = None
 
-def get_synthetic_example(db, num_lines=24):
+def get_synthetic_example(db, num_lines=24, exclude=None):
+    global _line_pool
     if not db: return "No lyrics found in database."
-    all_lines = []
-    for song in db:
-        lines = [l.strip() for l in song['lyrics'].split('\n') if l.strip() and not (l.startswith('[') and l.endswith(']'))]
-        all_lines.extend(lines)
-    if not all_lines: return "Database empty."
-    sample = random.sample(all_lines, min(num_lines, len(all_lines)))
+    if _line_pool is None or _line_pool.index is not db:
+        _line_pool = LinePool(db)
+    sample = _line_pool.sync().sample(num_lines, exclude=exclude)
+    if not sample: return "Database empty."
     return "\n".join(sample)
 
-async def get_text_from_llm(system, task, tag):
+# Отдельный пул потоков под g4f: зависшие провайдеры не должны забивать дефолтный executor asyncio
+LLM_THREADS = max(8, LLM_HEDGE_FANOUT * 4)
+_llm_executor = ThreadPoolExecutor(max_workers=LLM_THREADS, thread_name_prefix="llm")
+_llm_lock = threading.Lock()
+_llm_orphans = 0   # потоки, чей вызов уже брошен по таймауту или отмене, а g4f из него еще не вернулся
+
+def _orphan_done(_):
+    global _llm_orphans
+    with _llm_lock: _llm_orphans -= 1
+
+async def run_llm_call(call):
+    """
+    Блокирующий вызов g4f в пуле потоков. Возвращает (ответ, секунды работы вызова).
+    Таймаут LLM_REQUEST_TIMEOUT отсчитывается с момента, когда поток взялся за вызов: ожидание
+    свободного потока провайдеру в вину не ставится. Брошенный вызов держит поток, пока g4f не вернется, —
+    пока таких слишком много, новые вызовы ждут, чтобы LLM_HEDGE_FANOUT потоков всегда оставались живым запросам.
+    """
+    global _llm_orphans
+    while _llm_orphans > LLM_THREADS - LLM_HEDGE_FANOUT:
+        await asyncio.sleep(1)
+
+    loop = asyncio.get_running_loop()
+    started = loop.create_future()
+
+    def run():
+        loop.call_soon_threadsafe(lambda: started.done() or started.set_result(time.monotonic()))
+        return call()
+
+    job = _llm_executor.submit(run)
+    try:
+        t0 = await started
+        resp = await asyncio.wait_for(asyncio.wrap_future(job), LLM_REQUEST_TIMEOUT)
+        return resp, time.monotonic() - t0
+    finally:
+        # Еще в очереди — просто снимаем; уже работает — поток занят, пока g4f не вернется
+        if not job.cancel() and not job.done():
+            with _llm_lock: _llm_orphans += 1
+            job.add_done_callback(_orphan_done)
+
+async def ask_provider(p_info, model, system, task, tag, attempt, n_active, denials):
+    """Одна попытка у одного провайдера. Возвращает чистый текст или None (с баном/логом причины)."""
+    p_name = p_info["provider"]
+    p_class = getattr(g4f.Provider, p_name, None)
+
+    if not p_class:
+        mark_inactive(p_name, model, "missing")
+        return None
+
+    started = time.monotonic()
+    try:
+        print(f"\n📡 [ATTEMPT {attempt}] [{tag}] Запрос к {p_name} ({model})...")
+
+        call = functools.partial(
+            g4f.ChatCompletion.create,
+            model=model, provider=p_class,
+            messages=[{"role": "system", "content": system}, {"role": "user", "content": task}],
+            stream=False, timeout=LLM_REQUEST_TIMEOUT
+        )
+        resp, latency = await run_llm_call(call)
+
+        if not resp:
+            mark_inactive(p_name, model, "empty", latency)
+            return None
+
+        # СНАЧАЛА чистим ответ от мыслей, тегов и мусора
+        text = super_clean(str(resp))
+
+        # ТЕПЕРЬ выводим в лог (можно выводить чистый текст, чтобы видеть результат)
+        print(f"📩 [{tag}] ОЧИЩЕННЫЙ ОТВЕТ: {text}...")
+
+        # И ТЕПЕРЬ проверяем очищенный текст на отказы (denials)
+        rule = denials.search(text)
+        if rule:
+            print(f"🚫 [{tag}] Очищенный текст содержит отказ от {p_name} (правило: «{rule}»). Пробую другого.")
+            record_outcome(p_name, model, "denial", latency)
+            if n_active <= 1: scoreboard.reset_cooldowns()
+            return None
+
+        if len(text) < 15:
+            print(f"⚠️ [{tag}] Слишком короткий текст после очистки от {p_name}.")
+            mark_inactive(p_name, model, "short", latency)
+            return None
+
+        record_outcome(p_name, model, "ok", latency)
+        return text
+
+    except asyncio.TimeoutError:
+        print(f"⏰ [{tag}] {p_name} не ответил за {LLM_REQUEST_TIMEOUT} сек.")
+        mark_inactive(p_name, model, "timeout", LLM_REQUEST_TIMEOUT)
+    except Exception as e:
+        print(f"❌ Ошибка {p_name}: {e}")
+        mark_inactive(p_name, model, "error", time.monotonic() - started)
+        await asyncio.sleep(0.5)
+    return None
+
+async def get_text_from_llm(system, task, tag, info=None):
+    """
+    Хеджированный запрос: держим до LLM_HEDGE_FANOUT запросов к разным провайдерам.
+    Запасной запрос стартует, если за LLM_HEDGE_DELAY сек никто не ответил (0 — веером сразу),
+    или сразу после неудачи. Первый ответ, прошедший чистку и проверки, выигрывает, остальные отменяются.
+    info: необязательный dict — в него пишутся provider и model победителя.
+    """
     providers_info = load_providers()
-    denials = load_denials()
-    
-    for attempt in range(50):
-        inactive_map = load_inactive()
-        active = [p for p in providers_info if is_provider_active(p["provider"], inactive_map)]
-        
-        if not active:
-            print("🔄 Все провайдеры в бане, сбрасываю...")
-            save_inactive({})
-            await asyncio.sleep(1)
-            continue
-
-        p_info = random.choice(active)
-        p_name, model = p_info["provider"], random.choice(p_info["models"])
-        p_class = getattr(g4f.Provider, p_name, None)
-
-        if not p_class:
-            mark_inactive(p_name)
-            continue
-
-        try:
-            print(f"\n📡 [ATTEMPT {attempt+1}] [{tag}] Запрос к {p_name}...")
-            
-            resp = await asyncio.to_thread(
-                g4f.ChatCompletion.create,
-                model=model, provider=p_class,
-                messages=[{"role": "system", "content": system}, {"role": "user", "content": task}],
-                stream=False
-            )
-
-            if not resp:
-                mark_inactive(p_name)
-                continue
-
-            # СНАЧАЛА чистим ответ от мыслей, тегов и мусора
-            text = super_clean(str(resp))
-            
-            # ТЕПЕРЬ выводим в лог (можно выводить чистый текст, чтобы видеть результат)
-            print(f"📩 [{tag}] ОЧИЩЕННЫЙ ОТВЕТ: {text}...")
-
-            # И ТЕПЕРЬ проверяем очищенный текст на отказы (denials)
-            if any(d in text.lower() for d in denials):
-                print(f"🚫 [{tag}] Очищенный текст содержит отказ от {p_name}. Пробую другого.")
-                if len(active) <= 1: save_inactive({})
-                continue
-
-            if len(text) < 15:
-                print(f"⚠️ [{tag}] Слишком короткий текст после очистки от {p_name}.")
-                mark_inactive(p_name)
-                continue
-
-            if tag == "LYRICS":
-                text = f"{text}\n\n[Refrain]\nПиськи сиськи пёзды залупки"
-                print("🎸 Рефрен прихардкожен.")
-
-            return text
-            
-        except Exception as e:
-            print(f"❌ Ошибка {p_name}: {e}")
-            mark_inactive(p_name)
-            await asyncio.sleep(0.5)
+    denials = live_config.get_denials()
+
+    pending = {}  # task -> (провайдер, модель)
+    attempt = 0
+    last_launch = 0.0
+
+    try:
+        while pending or attempt < LLM_MAX_ATTEMPTS:
+            can_launch = attempt < LLM_MAX_ATTEMPTS and len(pending) < LLM_HEDGE_FANOUT
+            hedge_due = time.monotonic() - last_launch >= LLM_HEDGE_DELAY
+
+            if can_launch and (not pending or hedge_due):
+                attempt += 1
+                active = [p for p in providers_info if scoreboard.is_active(p["provider"])]
+
+                if not active:
+                    if pending:
+                        attempt -= 1
+                        can_launch = False
+                    else:
+                        print("🔄 Все провайдеры в бане, сбрасываю...")
+                        scoreboard.reset_cooldowns()
+                        await asyncio.sleep(1)
+                        continue
+                else:
+                    # Параллельные запросы — по возможности к разным провайдерам
+                    p_info, model = scoreboard.choose(active, exclude={p for p, _ in pending.values()})
+                    task_ = asyncio.create_task(ask_provider(p_info, model, system, task, tag, attempt, len(active), denials))
+                    pending[task_] = (p_info["provider"], model)
+                    last_launch = time.monotonic()
+                    if len(pending) > 1:
+                        print(f"🪁 [{tag}] Хедж: параллельно ждем {len(pending)} провайдеров")
+                    continue
+
+            timeout = max(0.0, LLM_HEDGE_DELAY - (time.monotonic() - last_launch)) if can_launch else None
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                p_name, model = pending.pop(t)
+                text = t.result()
+                if not text: continue
+
+                print(f"🏁 [{tag}] Победил {p_name}")
+                if info is not None: info.update(provider=p_name, model=model)
+                if tag == "LYRICS":
+                    text = f"{text}\n\n[Refrain]\nПиськи сиськи пёзды залупки"
+                    print("🎸 Рефрен прихардкожен.")
+                return text
+    finally:
+        for t in pending: t.cancel()
     return None
 
+_sung_history = None
+
+def get_sung_history():
+    """Общая история спетых песен (журнал + индекс в памяти)."""
+    global _sung_history
+    if _sung_history is None:
+        _sung_history = SungHistory()
+    return _sung_history
+
 # Заглушки для совместимости
 def load_sung_history():
-    if not os.path.exists(SUNG_HISTORY_FILE):
-        return []
-    try:
-        with open(SUNG_HISTORY_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data if isinstance(data, list) else []
-    except Exception as e:
-        print(f"⚠️ Ошибка чтения истории спетых песен: {e}")
-        return []
+    return get_sung_history().ids()
 
 def save_sung_history(history):
-    try:
-        with open(SUNG_HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"❌ Не удалось сохранить историю: {e}")
+    store = get_sung_history()
+    for song_id in history: store.add(song_id)
         
 async def run_lyrics_monster(): return True
@@ -3,100 +3,131 @@ import logging
 import shutil
 import os
 import random
-import json
+import math
 from config import *
 import lyrics_manager as lm
 import audio_utils as au
 import ace_engine as ace
 import tg_handler as tg
+import metrics
+import media_jobs
+import live_config
+from text_spool import TextSpool, SpoolItem
+from segment_journal import SegmentJournal, file_hash
+from album_renderer import RollingRenderer
+from song_scheduler import SongScheduler
+from album_registry import AlbumRegistry
+from upload_queue import UploadQueue
 
 logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(levelname)s: %(message)s")
 logger = logging.getLogger(__name__)
 
-async def text_provider_worker(queue, stop_event):
-    print("🤖 Воркер текстов запущен.")
-    
-    # Загружаем историю один раз при старте
-    history = lm.load_sung_history()
-    # Множество для быстрого поиска и учета тех, что "в работе" прямо сейчас
-    used_ids = set(history)
+async def text_provider_worker(queue, stop_event, scheduler, history, worker_id=1):
+    """
+    Один из TEXT_WORKERS воркеров. Caption и lyrics запрашиваются параллельно,
+    готовая пара кладется в спул (TextSpool) — когда он полон, воркер просто ждет на put().
+    scheduler общий для всех воркеров: выдает неспетые песни и держит те, что уже в работе.
+    history — журнал спетых песен (SungHistory).
+    """
+    print(f"🤖 Воркер текстов #{worker_id} запущен.")
 
     while not stop_event.is_set():
-        if queue.qsize() < 15:
-            try:
-                db = lm.parse_lyrics_database()
-                
-                # Ищем песню, которой нет в истории и которая не взята в этом сеансе
-                ref_song = next((s for s in db if s["id"] not in used_ids), None)
-                
-                if not ref_song:
-                    print("🎲 Новых песен в базе нет. Генерирую микс...")
-                    lyr_task = f"Напиши новую песню, вдохновляясь этим набором фраз:\n\n{lm.get_synthetic_example(db)}"
-                    is_synthetic = True
-                else:
-                    print(f"📖 Воркер выбрал песню: {ref_song['id']}")
-                    # Сразу помечаем как использованную, чтобы следующая итерация цикла её не взяла
-                    used_ids.add(ref_song["id"])
-                    lyr_task = f"Напиши песню на основе этого текста:\n\n{ref_song['lyrics']}"
-                    is_synthetic = False
-
-                # Загружаем промпты
-                sys_caption = lm.load_prompt(PROMPT_CAPTION_FILE, "Act as an RnB producer.")
-                caption_task = lm.load_prompt("prompt_caption_task.txt", "Describe a professional house pop hit.")
-                sys_lyrics = lm.load_prompt(PROMPT_LYRICS_FILE, "Act as a viral pop-star writer.")
-
-                # Запросы к LLM (это долго)
-                cap = await lm.get_text_from_llm(sys_caption, caption_task, "CAPTION")
-                lyr = await lm.get_text_from_llm(sys_lyrics, lyr_task, "LYRICS")
-                
-                if cap and lyr:
-                    if not is_synthetic and ref_song:
-                        # Сохраняем в файл только при успешной генерации
-                        current_history = lm.load_sung_history()
-                        if ref_song["id"] not in current_history:
-                            current_history.append(ref_song["id"])
-                            lm.save_sung_history(current_history)
-                    
-                    await queue.put((cap, lyr))
-                    print(f"✅ Текст готово. В очереди: {queue.qsize()}")
-                else:
-                    # Если LLM упала, а песня была не синтетическая — возвращаем ID в пул
-                    if not is_synthetic and ref_song:
-                        used_ids.remove(ref_song["id"])
-                
-            except Exception as e:
-                print(f"❌ Ошибка воркера: {e}")
-                
-        await asyncio.sleep(1)
-
-async def create_album(text_queue):
-    album_id = str(random.randint(10**15, 10**16 - 1))
-    
-    # 1. Пытаемся восстановить ID старого альбома из метаданных
-    if os.path.exists(ALBUM_META_FILE):
+        ref_song = None
         try:
-            with open(ALBUM_META_FILE, "r") as f:
-                data = json.load(f)
-                album_id = data.get("id", album_id)
-                print(f"🔄 ОБНАРУЖЕН НЕЗАВЕРШЕННЫЙ АЛЬБОМ: {album_id}")
-        except: pass
-    
-    with open(ALBUM_META_FILE, "w") as f:
-        json.dump({"id": album_id}, f)
-    
-    seg_dir = os.path.join(BASE_TEMP_DIR, f"segments_{album_id}")
+            db = lm.get_lyrics_index()
+            
+            # Берем следующую песню, которой нет в истории и которую не держит другой воркер.
+            # Между выбором и резервированием нет await, поэтому два воркера не возьмут один ID
+            picked = scheduler.reserve()
+            
+            if picked is None:
+                print(f"🎲 [#{worker_id}] Новых песен в базе нет. Генерирую микс...")
+                lyr_task = f"Напиши новую песню, вдохновляясь этим набором фраз:\n\n{lm.get_synthetic_example(db)}"
+            else:
+                ref_pos, ref_id = picked
+                ref_song = {"id": ref_id}
+                ref_song["lyrics"] = db.lyrics_at(ref_pos)
+                print(f"📖 Воркер #{worker_id} выбрал песню: {ref_song['id']}")
+                lyr_task = f"Напиши песню на основе этого текста:\n\n{ref_song['lyrics']}"
+
+            # Промпты из кэша: правки файлов подхватываются на лету, без чтения диска на каждом круге
+            sys_caption, caption_task, sys_lyrics = live_config.get_prompts()
+
+            # Запросы к LLM (это долго) — caption и lyrics независимы, идут одновременно
+            lyr_info = {}
+            cap, lyr = await asyncio.gather(
+                lm.get_text_from_llm(sys_caption, caption_task, "CAPTION"),
+                lm.get_text_from_llm(sys_lyrics, lyr_task, "LYRICS", info=lyr_info),
+            )
+            
+            if cap and lyr:
+                # Очередь ограничена: при полной очереди ждем здесь, а не опрашиваем qsize().
+                # Спул на диске, поэтому пара переживет рестарт
+                await queue.put(cap, lyr, ref_song["id"] if ref_song else None)
+                print(f"✅ Текст готов. В очереди: {queue.qsize()}")
+
+                if ref_song:
+                    # Сохраняем в историю только при успешной генерации: одна строка в журнал, без перезаписи файла
+                    history.add(ref_song["id"], provider=lyr_info.get("provider"), model=lyr_info.get("model"))
+                    scheduler.commit(ref_song["id"])
+                    ref_song = None
+            
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Ошибка воркера #{worker_id}: {e}")
+            await asyncio.sleep(1)
+        finally:
+            # Если LLM упала, а песня была не синтетическая — возвращаем ID в планировщик
+            if ref_song:
+                scheduler.release(ref_song["id"])
+
+@metrics.instrument("upload")
+async def upload_album(path, album_id):
+    return await tg.send_to_telegram(path, album_id)
+
+_ace_slots = None
+
+def ace_slots():
+    """Общий на все альбомы лимит генераций: столько, сколько экземпляров ACE в пуле."""
+    global _ace_slots
+    if _ace_slots is None: _ace_slots = asyncio.Semaphore(ace.pool.size)
+    return _ace_slots
+
+async def create_album(text_queue, history, albums, uploads, album_id, on_generated=None):
+    """
+    Один альбом от первого сегмента до отправки. Альбомов может идти несколько сразу:
+    тексты и экземпляры ACE у них общие. on_generated вызывается, когда все сегменты готовы —
+    дальше только финальный рендер и отправка, и следующий альбом уже может генерироваться.
+    """
+    seg_dir = albums.album_dir(album_id)
     os.makedirs(seg_dir, exist_ok=True)
+    work_dir = os.path.join(seg_dir, ".work")
+    os.makedirs(work_dir, exist_ok=True)
     
-    # 2. Считаем существующие сегменты и восстанавливаем время (cur_dur)
-    existing_files = sorted([f for f in os.listdir(seg_dir) if f.endswith(".flac")])
-    files_count = len(existing_files)
+    # 2. Журнал сегментов: после рестарта каждый сегмент продолжается с той стадии, до которой дошел,
+    # а длина альбома считается по измеренным длинам сегментов
+    journal = SegmentJournal(seg_dir)
+    await asyncio.to_thread(journal.measure)
+    cur_dur = journal.duration()
     
-    cur_dur = 0
-    if files_count > 0:
-        # Формула: Первый трек целиком + остальные с учетом кроссфейда
-        cur_dur = TRACK_DURATION + (files_count - 1) * (TRACK_DURATION - CROSSFADE_DURATION)
+    # Инкрементальный рендер: досводим в мастер то, что накопилось до рестарта
+    renderer = RollingRenderer(seg_dir)
+    try:
+        committed = [journal.segment_path(seg["idx"]) for seg in journal.segments if seg["state"] == "committed"]
+        # Мастер может опережать журнал на processed-сегменты: commit() сводит стык до отметки committed,
+        # а segment_NNN.flac у processed уже окончательный — их досведет commit(), catch_up пропустит сделанное.
+        # Дальше них мастер уйти не мог, разве что журнал выкинул недописанный сегмент: хвосты удалены, откатить нельзя
+        final = 0
+        while final < len(journal) and journal.segments[final]["state"] in ("processed", "committed"): final += 1
+        if renderer.rendered > final: raise RuntimeError("в мастере больше сегментов, чем в журнале")
+        await asyncio.to_thread(renderer.catch_up, committed)
+    except Exception as e:
+        print(f"⚠️ Не удалось досвести мастер, финал соберем целиком: {e}")
+        renderer = None
     
     def fmt(s): return f"{int(s//60):02d}:{int(s%60):02d}"
+    metrics.ALBUM_PROGRESS.set(cur_dur, album=album_id)
 
     print(f"\n{'='*60}")
     print(f"🚀 ЗАПУСК ПРОЦЕССА СОЗДАНИЯ АЛЬБОМА")
@@ -104,69 +135,206 @@ async def create_album(text_queue):
     print(f"⏱️  ПРОГРЕСС ПРИ СТАРТЕ: {fmt(cur_dur)} / {fmt(TARGET_TOTAL_SECONDS)}")
     print(f"📁 ПАПКА: {seg_dir}")
     print(f"{'='*60}\n")
-    
-    while cur_dur < TARGET_TOTAL_SECONDS:
-        await ace.wait_for_ace_server()
-        
-        print(f"⏳ Ожидание текстов из очереди (сейчас в очереди: {text_queue.qsize()})...")
-        cap, lyr = await text_queue.get()
-        print(f"✅ Тексты получены!")
-        bpm = random.randint(124, 130)
-        key = MUSIC_KEYS[files_count % len(MUSIC_KEYS)]
+
+    async def process(seg, path):
+        """Pitch rise / копирование в segment_NNN.flac — идет параллельно со следующей генерацией."""
+        idx = seg["idx"]
+        target = journal.segment_path(idx)
+        # Пишем во временный файл и переименовываем: в папке альбома не бывает недописанных сегментов
+        tmp = os.path.join(work_dir, os.path.basename(target))
         
-        # Считаем примерное общее кол-во треков для визуализации
-        total_tracks_est = int(TARGET_TOTAL_SECONDS // (TRACK_DURATION - CROSSFADE_DURATION))
-
-        # ВЫЗОВ ГЕНЕРАТОРА С ПЕРЕДАЧЕЙ ПРОГРЕССА
-        path = await asyncio.to_thread(
-            ace.generate_audio_segment,
-            cap,
-            lyr,
-            bpm,
-            key,
-            files_count + 1,    # Номер трека для лога (начиная с 1)
-            total_tracks_est,   # Всего треков
-            cur_dur             # Сколько секунд уже готово
-        )
+        # 3. Склейка сегментов. Pitch rise рассчитан на смену тональности на полутон —
+        # дубль в той же тональности, что и предыдущий сегмент (та же пачка ACE), берем как есть
+        same_key = idx > 0 and journal.segments[idx - 1].get("key") == seg.get("key")
+        if idx > 0 and not same_key:
+            print(f"🔗 Стык сегмента {idx} + {idx+1} (Pitch Rise / Crossfade)...")
+            if not await asyncio.to_thread(au.apply_pitch_rise, path, tmp, TRACK_DURATION, CROSSFADE_DURATION):
+                print(f"⚠️ Pitch Rise не удался, беру сегмент {idx+1} как есть")
+                await asyncio.to_thread(shutil.copy, path, tmp)
+        else:
+            print(f"💾 Сохранение сегмента {idx+1} без pitch rise...")
+            await asyncio.to_thread(shutil.copy, path, tmp)
+        os.replace(tmp, target)
+        sr, samples = await asyncio.to_thread(au.get_audio_info, target)
+        journal.mark(idx, "processed", duration=samples / sr)
+
+    async def commit(seg):
+        """Подтверждение текста, привязка песни к альбому и сведение в мастер. Каждый шаг можно повторить."""
+        nonlocal renderer
+        idx, item = seg["idx"], SpoolItem(**seg["text"])
+        await text_queue.ack(item.id)
+        if item.song_id: history.update(item.song_id, album=album_id)
+        # Сегмент в all_segments_history — сырой результат генерации больше не нужен, кэш Gradio держим коротким
+        gen_path = seg.get("gen_path")
+        if gen_path and os.path.exists(gen_path): os.remove(gen_path)
+        await asyncio.to_thread(ace.pool.sweep_caches)
         
-        if not path:
-            print(f"⚠️ Ошибка генерации. Возвращаем текст в очередь и перезагружаем сервер...")
-            await text_queue.put((cap, lyr))
-            await ace.wait_for_ace_server(force_restart=True)
-            continue
+        # Сразу сводим стык в мастер, чтобы финалу осталось только дописать хвост.
+        # catch_up пропускает уже сведенное, поэтому после падения между рендером и журналом стык не задвоится
+        if renderer:
+            try:
+                await asyncio.to_thread(renderer.catch_up, [journal.segment_path(i) for i in range(idx + 1)])
+            except Exception as e:
+                print(f"⚠️ Инкрементальный рендер сломался, финал соберем целиком: {e}")
+                renderer = None
+        journal.mark(idx, "committed")
+        print(f"✅ Сегмент {idx+1} обработан и сохранен.")
+
+    # Диспетчер: до pool.size генераций одновременно (на все альбомы), каждая на свободном экземпляре ACE.
+    # Пока идут генерации, готовые сегменты обрабатываются (sox, рендер) строго по номерам
+    slots = ace_slots()
+    ordered = asyncio.Queue()
+    gen_tasks = []
+    # Считаем примерное общее кол-во треков для визуализации
+    total_tracks_est = int(TARGET_TOTAL_SECONDS // (TRACK_DURATION - CROSSFADE_DURATION))
+
+    async def generate(segs, done_dur):
+        """
+        Генерация сегментов segs (дубли одного текста) одним вызовом ACE на свободном экземпляре.
+        Слот ace_slots() уже взят вызывающим. Если дублей пришло меньше — недостающие догенерируются.
+        """
+        item, first = SpoolItem(**segs[0]["text"]), segs[0]
+        paths = []
+        try:
+            while len(paths) < len(segs):
+                rest = segs[len(paths):]
+                inst = await ace.pool.acquire()
+                # ВЫЗОВ ГЕНЕРАТОРА С ПЕРЕДАЧЕЙ ПРОГРЕССА
+                got = await asyncio.to_thread(
+                    inst.generate_audio_takes,
+                    item.caption,
+                    item.lyrics,
+                    first["bpm"],
+                    first["key"],
+                    # Результаты этой задачи сразу забираем из кэша Gradio в папку альбома
+                    [os.path.join(work_dir, f"gen_{seg['idx']:03d}.flac") for seg in rest],
+                    rest[0]["idx"] + 1,  # Номер трека для лога (начиная с 1)
+                    total_tracks_est,    # Всего треков
+                    done_dur,            # Сколько секунд уже готово
+                )
+                if got:
+                    ace.pool.release(inst)
+                    for seg, path in zip(rest, got):
+                        # Результат генерации в журнале: после рестарта его не придется генерировать заново
+                        journal.mark(seg["idx"], "generated", gen_path=path, gen_hash=await asyncio.to_thread(file_hash, path))
+                    paths += got
+                    continue
+                # Перезапускаем только упавший экземпляр, текст уходит следующему свободному
+                print(f"⚠️ Ошибка генерации на {inst.name}. Перезагружаем его и повторяем с тем же текстом...")
+                ace.pool.restart(inst)
+        finally:
+            slots.release()
+        return paths
+
+    async def resume(segs, done_dur):
+        """Сегменты, прерванные рестартом: берем готовые результаты генерации, остальное генерируем тем же текстом."""
+        paths = [await asyncio.to_thread(journal.reusable, seg) if seg["state"] == "generated" else None for seg in segs]
+        missing = [seg for seg, path in zip(segs, paths) if not path]
+        for seg, path in zip(segs, paths):
+            if path: print(f"♻️ Сегмент {seg['idx']+1}: результат генерации до рестарта на месте, ACE не нужен")
+        if missing:
+            await slots.acquire()
+            fresh = iter(await generate(missing, done_dur))
+            paths = [path or next(fresh) for path in paths]
+        return paths
+
+    async def committer():
+        while True:
+            job = await ordered.get()
+            if job is None: return
+            seg, task, take = job
+            if task: await process(seg, (await task)[take])
+            await commit(seg)
+
+    def dispatch(segs, coro):
+        """Одна задача генерации на пачку; в очередь коммита — каждый сегмент пачки со своим номером дубля."""
+        task = asyncio.create_task(coro)
+        gen_tasks.append(task)
+        for take, seg in enumerate(segs): ordered.put_nowait((seg, task, take))
+
+    # Сначала — незавершенные сегменты прошлого запуска, каждый со своей стадии.
+    # Ждущие генерации дубли одного текста снова идут одной пачкой
+    batch = []
+    for seg in journal.pending() + [None]:
+        if batch and (seg is None or seg["state"] == "processed" or seg["text"]["id"] != batch[0]["text"]["id"]):
+            dispatch(batch, resume(batch, cur_dur))
+            batch = []
+        if seg is None: break
+        print(f"🔄 Сегмент {seg['idx']+1} продолжается со стадии {seg['state']}")
+        if seg["state"] == "processed": ordered.put_nowait((seg, None, 0))
+        else: batch.append(seg)
+
+    commit_task = asyncio.create_task(committer())
+
+    async def watched(coro):
+        """
+        Ждет coro (слот ACE, текст из спула), но если обработка сегментов упала — сразу поднимает ее ошибку:
+        иначе альбом часами брал бы тексты и гонял ACE, не сохраняя ни одного сегмента.
+        """
+        waiter = asyncio.ensure_future(coro)
+        await asyncio.wait({waiter, commit_task}, return_when=asyncio.FIRST_COMPLETED)
+        if waiter.done(): return waiter.result()
+        waiter.cancel()
+        commit_task.result()
+        raise RuntimeError("Обработка сегментов остановилась раньше конца альбома")
+
+    try:
+        while cur_dur < TARGET_TOTAL_SECONDS:
+            if commit_task.done(): commit_task.result()
+            await watched(slots.acquire())
             
-        target = os.path.join(seg_dir, f"segment_{files_count:03d}.flac")
-        
-        # 3. Склейка сегментов
-        if files_count > 0:
-            print(f"🔗 Стык сегмента {files_count} + {files_count+1} (Pitch Rise / Crossfade)...")
-            await asyncio.to_thread(au.apply_pitch_rise, path, target, TRACK_DURATION, CROSSFADE_DURATION)
-            cur_dur += (TRACK_DURATION - CROSSFADE_DURATION)
-        else:
-            print(f"💾 Сохранение начального сегмента...")
-            shutil.copy(path, target)
-            cur_dur += TRACK_DURATION
+            print(f"⏳ Ожидание текстов из очереди (сейчас в очереди: {text_queue.qsize()})...")
+            try:
+                item = await watched(text_queue.get())
+            except BaseException:
+                slots.release()
+                raise
+            print(f"✅ Тексты получены!")
+            # Один текст — ACE_BATCH_SIZE дублей за один вызов ACE, но не больше, чем нужно до конца альбома
+            idx, step = len(journal), TRACK_DURATION - CROSSFADE_DURATION
+            takes = max(1, min(ACE_BATCH_SIZE, math.ceil((TARGET_TOTAL_SECONDS - cur_dur - (CROSSFADE_DURATION if idx == 0 else 0)) / step)))
+            # Тональность шагает на полутон за вызов ACE, а не за сегмент: дубли одного текста идут в одной тональности
+            prev_key = journal.segments[-1].get("key") if journal.segments else None
+            step_key = MUSIC_KEYS.index(prev_key) + 1 if prev_key in MUSIC_KEYS else idx
+            bpm, key = random.randint(124, 130), MUSIC_KEYS[step_key % len(MUSIC_KEYS)]
+            for i in range(takes): journal.claim(idx + i, item, bpm, key)
+            segs = journal.segments[idx:]
+            dispatch(segs, generate(segs, cur_dur))
             
-        files_count += 1
-        text_queue.task_done()
+            cur_dur = journal.duration()
+            metrics.ALBUM_PROGRESS.set(cur_dur, album=album_id)
+            print(f"📋 Сегмент {idx+1}" + (f"-{idx+takes}" if takes > 1 else "") + f" отправлен в ACE. Длина альбома с ним: {fmt(cur_dur)}")
         
-        print(f"✅ УСПЕХ. Текущая длина альбома: {fmt(cur_dur)}")
+        ordered.put_nowait(None)
+        await commit_task
+    finally:
+        # Невыполненные генерации бросаем: журнал и спул держат их тексты до рестарта
+        for t in gen_tasks + [commit_task]:
+            if not t.done(): t.cancel()
+
+    albums.set_state(album_id, "rendering")
+    if on_generated: on_generated()
 
     # 4. Финальная сборка альбома
     print(f"\n{'='*60}")
     print(f"🏁 ЦЕЛЬ ДОСТИГНУТА! НАЧИНАЮ ФИНАЛЬНЫЙ РЕНДЕР...")
     
     final_m4a = os.path.join(ALBUMS_DIR, f"{album_id}.m4a")
-    all_files = sorted([os.path.join(seg_dir, f) for f in os.listdir(seg_dir) if f.endswith(".flac")])
+    all_files = [journal.segment_path(i) for i in range(len(journal)) if os.path.exists(journal.segment_path(i))]
     
     if all_files:
-        au.concat_segments(all_files, final_m4a)
-        print(f"📤 ОТПРАВКА В TELEGRAM: {final_m4a}")
-        asyncio.create_task(tg.send_to_telegram(final_m4a, album_id))
+        try:
+            if not renderer: raise RuntimeError("мастер не собран")
+            await asyncio.to_thread(renderer.finalize, final_m4a)
+        except Exception as e:
+            print(f"⚠️ Собираю альбом целиком через acrossfade ({e})")
+            await asyncio.to_thread(au.concat_segments, all_files, final_m4a)
+        # Отправка идет из персистентной очереди с повторами — следующий альбом ее не ждет
+        print(f"📤 В ОЧЕРЕДЬ ОТПРАВКИ В TELEGRAM: {final_m4a}")
+        await uploads.put(final_m4a, album_id)
     
-    # Очистка метаданных (альбом закончен)
-    if os.path.exists(ALBUM_META_FILE):
-        os.remove(ALBUM_META_FILE)
+    # Альбом закончен: после рестарта он больше не поднимется
+    albums.set_state(album_id, "done")
         
     print(f"✨ ПРОЦЕСС ЗАВЕРШЕН. АЛЬБОМ ГОТОВ!")
     print(f"{'='*60}\n")
@@ -179,8 +347,14 @@ async def main():
     os.makedirs(ALBUMS_DIR, exist_ok=True)
     os.makedirs(BASE_TEMP_DIR, exist_ok=True)
     
-    # Теперь эта функция будет писать "попытка 1, попытка 2..."
-    status = await ace.wait_for_ace_server()
+    # sox/ffmpeg из потоков обработки идут в очередь media_jobs этого event loop (лимит, таймауты, ядра MEDIA_CPUS)
+    media_jobs.jobs.bind()
+    
+    # Эндпоинт Prometheus: сколько времени уходит на каждую стадию и не пустеет ли спул
+    metrics_server = await metrics.serve()
+    
+    # Поднимаем все экземпляры ACE (каждый пишет "попытка 1, попытка 2...")
+    status = await ace.pool.start()
     if not status:
         print("🛑 КРИТИЧЕСКАЯ ОШИБКА: Не удалось достучаться до ACE. Выход.")
         return
@@ -189,24 +363,70 @@ async def main():
     await tg.client_tg.start()
     print("✅ Telegram подключен!")
     
-    t_queue = asyncio.Queue()
+    # Очередь отправки: недоотправленное с прошлого запуска уходит сразу
+    uploads = UploadQueue(upload_album)
+    uploads.start()
+    
+    # Спул на диске: готовые тексты прошлого запуска сразу доступны ACE
+    t_queue = TextSpool()
     stop_ev = asyncio.Event()
     
-    print("🤖 Запуск воркера текстов...")
-    worker = asyncio.create_task(text_provider_worker(t_queue, stop_ev))
+    # Планировщик песен-образцов: курсор по перестановке базы, занятые ID — история плюс песни в работе
+    history = lm.get_sung_history()
+    scheduler = SongScheduler(lm.get_lyrics_index(), history)
+    
+    print(f"🤖 Запуск воркеров текстов: {TEXT_WORKERS}...")
+    workers = [asyncio.create_task(text_provider_worker(t_queue, stop_ev, scheduler, history, i + 1)) for i in range(TEXT_WORKERS)]
+    
+    # Прогрев не нужен: create_album сам ждет на спуле, а после рестарта тексты там уже есть
+    print(f"📦 В спуле текстов: {t_queue.qsize()}")
+
+    # Реестр альбомов: все незавершенные альбомы поднимаются первыми
+    albums = AlbumRegistry()
+    resumed = albums.open_albums()
+    for album_id in resumed:
+        print(f"🔄 ОБНАРУЖЕН НЕЗАВЕРШЕННЫЙ АЛЬБОМ: {album_id}")
+        # Тексты его незавершенных сегментов спул вернул в очередь — забираем до старта альбомов, чтобы не ушли чужим
+        t_queue.reclaim(SegmentJournal(albums.album_dir(album_id)).text_ids())
     
-    # Даем воркеру время сделать первый запрос
-    print("⏳ Ожидание наполнения очереди текстов...")
-    while t_queue.empty():
-        await asyncio.sleep(2)
-        print(f"   ...в очереди пока {t_queue.qsize()} текстов")
+    # Генерируют одновременно до ALBUMS_IN_PARALLEL альбомов; рендер и отправка место не держат
+    album_slots = asyncio.Semaphore(ALBUMS_IN_PARALLEL)
+    album_tasks = []
+
+    async def produce(album_id):
+        released = False
+        def generated():
+            nonlocal released
+            if not released:
+                released = True
+                album_slots.release()
+        try:
+            await create_album(t_queue, history, albums, uploads, album_id, on_generated=generated)
+        finally:
+            generated()
 
     try:
-        for i in range(ALBUMS_TO_GENERATE):
-            await create_album(t_queue)
+        for i in range(max(ALBUMS_TO_GENERATE, len(resumed))):
+            await album_slots.acquire()
+            # Упавший альбом останавливает программу, как и раньше
+            for t in album_tasks:
+                if t.done(): t.result()
+            album_id = resumed[i] if i < len(resumed) else albums.new_album()
+            album_tasks.append(asyncio.create_task(produce(album_id)))
+        await asyncio.gather(*album_tasks)
     finally:
+        for t in album_tasks:
+            if not t.done(): t.cancel()
         stop_ev.set()
+        for w in workers: w.cancel()
+        t_queue.close()
+        lm.scoreboard.flush()
+        print("📊 ТАБЛО ПРОВАЙДЕРОВ:\n" + lm.scoreboard.dump(lm.load_providers()))
+        # Не рвем соединение посреди отправки: ждем очередь (с таймаутом), остаток уйдет после рестарта
+        await uploads.drain()
+        uploads.close()
         await tg.client_tg.disconnect()
+        if metrics_server: metrics_server.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,125 @@
+import os
+import time
+import shutil
+import asyncio
+import logging
+from collections import namedtuple
+import metrics
+from config import *
+
+logger = logging.getLogger(__name__)
+
+STDERR_TAIL = 4000   # сколько последних символов stderr сохраняем в ошибке
+
+JobResult = namedtuple("JobResult", ["stdout", "stderr", "elapsed"])
+
+class MediaJobError(RuntimeError):
+    """Сбой внешней утилиты: команда, код выхода, хвост stderr, время работы и был ли это таймаут."""
+
+    def __init__(self, cmd, returncode, stderr, elapsed, timed_out=False):
+        self.cmd = list(cmd)
+        self.tool = os.path.basename(self.cmd[0])
+        self.returncode = returncode
+        self.stderr = stderr[-STDERR_TAIL:]
+        self.elapsed = elapsed
+        self.timed_out = timed_out
+        lines = self.stderr.strip().splitlines()
+        what = f"таймаут {elapsed:.0f} сек" if timed_out else f"код {returncode} за {elapsed:.1f} сек"
+        super().__init__(f"{self.tool}: {what}: {lines[-1] if lines else 'stderr пуст'}")
+
+def all_cpus():
+    if hasattr(os, "sched_getaffinity"): return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def ace_cpu_sets(n_instances, media_cpus=MEDIA_CPUS):
+    """
+    Ядра экземпляров ACE, когда ACE_INSTANCE_CPUS не задан: все, кроме MEDIA_CPUS, поровну на экземпляр.
+    Без MEDIA_CPUS (или если других ядер нет) — None, ACE без привязки.
+    """
+    rest = [c for c in all_cpus() if c not in set(media_cpus or ())]
+    if not media_cpus or not rest: return [None] * n_instances
+    return [rest[i * len(rest) // n_instances:(i + 1) * len(rest) // n_instances] or rest for i in range(n_instances)]
+
+def _text(data):
+    return data.decode("utf-8", errors="replace") if data else ""
+
+class MediaJobs:
+    """
+    Исполнитель sox/ffmpeg/ffprobe на asyncio-подпроцессах: не больше limit одновременно (общая очередь
+    на все альбомы), таймаут на каждый вызов, stderr — в MediaJobError, процессы привязаны к ядрам cpus
+    (MEDIA_CPUS), чтобы не отбирать их у ACE.
+    Код обработки звука синхронный и крутится в asyncio.to_thread — он зовет run_sync, и задача уходит
+    в event loop, привязанный через bind(). Без него (бенчмарки, скрипты) run_sync поднимает временный loop.
+    """
+
+    def __init__(self, limit=MEDIA_JOBS, timeout=MEDIA_JOB_TIMEOUT, cpus=MEDIA_CPUS):
+        self.loop = None
+        self.configure(limit, timeout, cpus)
+
+    def configure(self, limit=MEDIA_JOBS, timeout=MEDIA_JOB_TIMEOUT, cpus=MEDIA_CPUS):
+        self.cpus = set(cpus) if cpus else None
+        self.taskset = shutil.which("taskset") if self.cpus else None
+        if self.cpus and not self.taskset:
+            logger.warning("⚠️ taskset не найден — sox/ffmpeg пойдут без привязки к MEDIA_CPUS")
+        self.limit = limit or (len(self.cpus) if self.cpus else os.cpu_count() or 1)
+        self.timeout = timeout
+        self._sem, self._sem_loop = None, None
+
+    def bind(self):
+        """Вызывается из работающего event loop (main): все run_sync из потоков пойдут в него."""
+        self.loop = asyncio.get_running_loop()
+
+    async def run(self, cmd, timeout=None):
+        loop = asyncio.get_running_loop()
+        if self._sem_loop is not loop:
+            self._sem, self._sem_loop = asyncio.Semaphore(self.limit), loop
+        timeout = timeout or self.timeout
+        tool = os.path.basename(cmd[0])
+        async with self._sem:
+            start = time.monotonic()
+            proc = await asyncio.create_subprocess_exec(
+                *self._pinned(cmd), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            comm = asyncio.ensure_future(proc.communicate())
+            try:
+                done, _ = await asyncio.wait({comm}, timeout=timeout)
+                if not done:
+                    proc.kill()
+                    _, err = await comm
+                    metrics.MEDIA_JOB_SECONDS.observe(time.monotonic() - start, tool=tool, outcome="timeout")
+                    raise MediaJobError(cmd, proc.returncode, _text(err), time.monotonic() - start, timed_out=True)
+                out, err = comm.result()
+            finally:
+                # Отмена (остановка альбома) не должна оставлять sox/ffmpeg сиротами
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+            elapsed = time.monotonic() - start
+            metrics.MEDIA_JOB_SECONDS.observe(elapsed, tool=tool, outcome="ok" if proc.returncode == 0 else "error")
+            if proc.returncode != 0:
+                raise MediaJobError(cmd, proc.returncode, _text(err), elapsed)
+            return JobResult(_text(out), _text(err), elapsed)
+
+    def run_sync(self, cmd, timeout=None):
+        """Блокирующий вызов для кода в потоках: задача встает в общую очередь event loop и ждется здесь."""
+        loop = self.loop
+        if loop is not None and loop.is_running():
+            try:
+                current = asyncio.get_running_loop()
+            except RuntimeError:
+                current = None
+            if current is loop:
+                raise RuntimeError("run_sync из event loop заблокирует его — нужен await run()")
+            return asyncio.run_coroutine_threadsafe(self.run(cmd, timeout), loop).result()
+        return asyncio.run(self.run(cmd, timeout))
+
+    def _pinned(self, cmd):
+        # Привязка через taskset, а не preexec_fn: Python-код между fork и exec в процессе с потоками
+        # (to_thread, пул LLM) может повиснуть. taskset наследуют все потоки sox/ffmpeg
+        if not self.cpus or not self.taskset: return cmd
+        return [self.taskset, "-c", ",".join(str(c) for c in sorted(self.cpus))] + list(cmd)
+
+jobs = MediaJobs()
+
+def run(cmd, timeout=None):
+    return jobs.run_sync(cmd, timeout)
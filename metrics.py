@@ -0,0 +1,178 @@
+import json
+import time
+import asyncio
+import logging
+import threading
+import functools
+from config import *
+
+logger = logging.getLogger(__name__)
+
+# Метрики конвейера: счетчики, гистограммы задержек, датчики. Живут в памяти процесса,
+# отдаются в формате Prometheus на METRICS_PORT и, по желанию, пишутся в METRICS_JSONL_FILE.
+
+DEFAULT_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200)
+
+REGISTRY = []
+_lock = threading.Lock()   # наблюдения приходят и из event loop, и из потоков to_thread
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(l, "")) for l in self.labels)
+
+    def _labels(self, key, extra=None):
+        pairs = list(zip(self.labels, key)) + (extra or [])
+        if not pairs: return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            for key, value in sorted(self.values.items()):
+                lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{self._labels(key)} {_num(value)}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        _emit(self.name, labels, amount)
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with _lock:
+            self.values[self._key(labels)] = value
+        _emit(self.name, labels, value)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            counts, total, n = self.values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound: counts[i] += 1
+            self.values[key] = (counts, total + value, n + 1)
+        _emit(self.name, labels, value)
+
+    def _render_value(self, key, value):
+        counts, total, n = value
+        lines = [f"{self.name}_bucket{self._labels(key, [('le', _num(b))])} {c}" for b, c in zip(self.buckets, counts)]
+        lines.append(f"{self.name}_bucket{self._labels(key, [('le', '+Inf')])} {n}")
+        lines.append(f"{self.name}_sum{self._labels(key)} {_num(total)}")
+        lines.append(f"{self.name}_count{self._labels(key)} {n}")
+        return lines
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _num(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _emit(name, labels, value):
+    if not METRICS_JSONL_FILE: return
+    line = json.dumps({"ts": round(time.time(), 3), "metric": name, "labels": labels, "value": value}, ensure_ascii=False)
+    try:
+        with _lock, open(METRICS_JSONL_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except Exception as e:
+        logger.warning(f"Не удалось записать метрику в {METRICS_JSONL_FILE}: {e}")
+
+def render_all():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# --- Метрики конвейера ---
+
+LLM_REQUEST_SECONDS = Histogram("llm_request_seconds", "Запрос к одному LLM-провайдеру", ("provider", "model", "outcome"))
+LLM_OUTCOMES_NO_LATENCY = Counter("llm_outcomes_no_latency_total", "Исходы без запроса к провайдеру (например, missing)", ("provider", "model", "outcome"))
+ACE_GENERATION_SECONDS = Histogram("ace_generation_seconds", "Генерация одного сегмента в ACE", ("instance", "outcome"))
+STAGE_SECONDS = Histogram("stage_seconds", "Обработка: pitch_rise, render_step, concat, final_encode, upload", ("stage", "outcome"))
+MEDIA_JOB_SECONDS = Histogram("media_job_seconds", "Один вызов sox/ffmpeg/ffprobe в media_jobs", ("tool", "outcome"))
+ACE_RESTARTS = Counter("ace_restarts_total", "Перезапуски экземпляров ACE", ("instance",))
+TEXT_QUEUE_DEPTH = Gauge("text_queue_depth", "Готовых пар caption/lyrics в спуле")
+TEXT_QUEUE_STARVED = Counter("text_queue_starved_seconds_total", "Сколько секунд генерация ждала тексты на пустом спуле")
+ALBUM_PROGRESS = Gauge("album_progress_seconds", "Длина альбома с отправленными в ACE сегментами (cur_dur)", ("album",))
+ALBUM_TARGET = Gauge("album_target_seconds", "Целевая длина альбома (TARGET_TOTAL_SECONDS)")
+
+def instrument(stage):
+    """Декоратор: время вызова в stage_seconds. Исключение или возврат False считаются outcome="error"."""
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                start, outcome = time.monotonic(), "error"
+                try:
+                    result = await fn(*args, **kwargs)
+                    if result is not False: outcome = "ok"
+                    return result
+                finally:
+                    STAGE_SECONDS.observe(time.monotonic() - start, stage=stage, outcome=outcome)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start, outcome = time.monotonic(), "error"
+                try:
+                    result = fn(*args, **kwargs)
+                    if result is not False: outcome = "ok"
+                    return result
+                finally:
+                    STAGE_SECONDS.observe(time.monotonic() - start, stage=stage, outcome=outcome)
+        return wrapper
+    return decorate
+
+# --- HTTP-эндпоинт для Prometheus ---
+
+async def _handle(reader, writer):
+    try:
+        request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+        path = request.split(b" ", 2)[1] if request.count(b" ") >= 2 else b"/"
+        if path.split(b"?")[0] in (b"/", b"/metrics"):
+            status, body = "200 OK", render_all().encode("utf-8")
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii") + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(host=METRICS_HOST, port=METRICS_PORT):
+    """Поднимает эндпоинт /metrics. Возвращает asyncio.Server (или None, если METRICS_PORT = 0)."""
+    if not port: return None
+    ALBUM_TARGET.set(TARGET_TOTAL_SECONDS)
+    try:
+        server = await asyncio.start_server(_handle, host, port)
+    except OSError as e:
+        print(f"⚠️ Метрики не подняты на {host}:{port}: {e}")
+        return None
+    print(f"📈 Метрики: http://{host}:{port}/metrics")
+    return server
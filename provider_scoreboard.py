@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+from config import *
+
+logger = logging.getLogger(__name__)
+
+INACTIVE_SECONDS = 10 * 60
+EWMA_ALPHA = 0.3
+PRIOR_LATENCY = 30.0   # сколько секунд считаем "средним" ответом, пока по паре нет замеров
+
+class ProviderScoreboard:
+    """
+    Табло провайдеров в памяти: по каждой паре провайдер/модель — EWMA задержки,
+    успехи, отказы (denials), ошибки; по провайдеру — кулдаун (бывший inactive_providers.json).
+    Выбор — Thompson sampling: шанс успеха из Beta-распределения, деленный на ожидаемую задержку.
+    На диск сбрасывается раз в PROVIDER_STATS_FLUSH_SECONDS и при остановке.
+    """
+
+    def __init__(self, path=PROVIDER_STATS_FILE):
+        self.path = path
+        self.stats = {}      # "Provider:model" -> dict
+        self.cooldowns = {}  # provider -> unix-время конца бана
+        self.dirty = False
+        self.last_flush = time.time()
+        self._load()
+
+    # --- Состояние провайдеров ---
+
+    def is_active(self, p_name):
+        until = self.cooldowns.get(p_name)
+        return not until or time.time() > until
+
+    def cooldown(self, p_name, seconds=INACTIVE_SECONDS):
+        self.cooldowns[p_name] = time.time() + seconds
+        self.dirty = True
+
+    def reset_cooldowns(self):
+        self.cooldowns = {}
+        self.dirty = True
+
+    def record(self, p_name, model, outcome, latency=None):
+        """outcome: ok | denial | short | empty | error | timeout | missing"""
+        s = self.stats.setdefault(f"{p_name}:{model}", {
+            "ok": 0, "fail": 0, "denial": 0, "latency": None, "last": 0
+        })
+        if outcome == "ok": s["ok"] += 1
+        elif outcome == "denial": s["denial"] += 1
+        else: s["fail"] += 1
+        if latency is not None:
+            s["latency"] = latency if s["latency"] is None else (1 - EWMA_ALPHA) * s["latency"] + EWMA_ALPHA * latency
+        s["last"] = time.time()
+        self.dirty = True
+        self.maybe_flush()
+
+    # --- Выбор ---
+
+    def score(self, key, sample=True):
+        s = self.stats.get(key)
+        ok, bad = (s["ok"], s["fail"] + s["denial"]) if s else (0, 0)
+        p = random.betavariate(ok + 1, bad + 1) if sample else (ok + 1) / (ok + bad + 2)
+        latency = s["latency"] if s and s["latency"] else PRIOR_LATENCY
+        return p / max(latency, 0.1)
+
+    def choose(self, providers_info, exclude=()):
+        """Возвращает (p_info, model) среди активных провайдеров; exclude — провайдеры, уже занятые хеджем."""
+        candidates = [(p, m) for p in providers_info if self.is_active(p["provider"]) for m in p["models"]]
+        preferred = [(p, m) for p, m in candidates if p["provider"] not in exclude]
+        candidates = preferred or candidates
+        if not candidates: return None
+        return max(candidates, key=lambda c: self.score(f"{c[0]['provider']}:{c[1]}"))
+
+    # --- Диск ---
+
+    def maybe_flush(self):
+        if self.dirty and time.time() - self.last_flush >= PROVIDER_STATS_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.time()
+        if not self.dirty: return
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"stats": self.stats, "cooldowns": self.cooldowns}, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            self.dirty = False
+        except Exception as e:
+            print(f"⚠️ Не удалось сохранить табло провайдеров: {e}")
+
+    def _load(self):
+        if not os.path.exists(self.path): return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f: data = json.load(f)
+            self.stats = data.get("stats", {})
+            self.cooldowns = data.get("cooldowns", {})
+        except Exception as e:
+            print(f"⚠️ Табло провайдеров повреждено, начинаю с нуля: {e}")
+
+    def dump(self, providers_info=None):
+        """Таблица для лога/CLI, лучшие пары сверху. Пары из providers_list.txt без статистики — внизу."""
+        keys = set(self.stats)
+        if providers_info:
+            keys |= {f"{p['provider']}:{m}" for p in providers_info for m in p["models"]}
+        rows = sorted(keys, key=lambda k: self.score(k, sample=False), reverse=True)
+        lines = [f"{'ПРОВАЙДЕР:МОДЕЛЬ':<60} {'OK':>5} {'FAIL':>5} {'DENY':>5} {'LAT,с':>7} {'SCORE':>8}  БАН"]
+        for k in rows:
+            s = self.stats.get(k)
+            p_name = k.split(":", 1)[0]
+            ban = "" if self.is_active(p_name) else f"{int(self.cooldowns[p_name] - time.time())}с"
+            if not s:
+                lines.append(f"{k:<60} {'-':>5} {'-':>5} {'-':>5} {'-':>7} {'-':>8}  {ban}")
+                continue
+            lat = f"{s['latency']:.1f}" if s["latency"] else "-"
+            lines.append(f"{k:<60} {s['ok']:>5} {s['fail']:>5} {s['denial']:>5} {lat:>7} {self.score(k, sample=False):>8.4f}  {ban}")
+        return "\n".join(lines)
+
+if __name__ == "__main__":
+    # python provider_scoreboard.py — показать, какие записи providers_list.txt стоит оставить
+    import lyrics_manager as lm
+    path = sys.argv[1] if len(sys.argv) > 1 else PROVIDER_STATS_FILE
+    print(ProviderScoreboard(path).dump(lm.load_providers()))
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import audio_utils as au
+from config import *
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_NAME = "segments.json"
+STATES = ("claimed", "generated", "processed", "committed")
+MIN_SEGMENT_SECONDS = TRACK_DURATION / 2   # перенесенный по файлам сегмент короче этого считаем недописанным
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""): h.update(block)
+    return h.hexdigest()
+
+class SegmentJournal:
+    """
+    Журнал сегментов альбома: segments.json в папке альбома, переписывается через временный файл и rename.
+    Запись сегмента — {"idx", "state", "text", "bpm", "key", ...}, состояния по порядку:
+      claimed   — текст взят из спула (копия текста в журнале, сам текст в спуле не подтвержден);
+      generated — ACE отдал файл: gen_path и gen_hash (sha256) — после рестарта генерация не повторяется;
+      processed — segment_NNN.flac записан, duration — его измеренная длина;
+      committed — текст подтвержден в спуле, песня привязана к альбому, сегмент сведен в мастер.
+    После рестарта каждый сегмент продолжается ровно с той стадии, до которой дошел.
+    Папки альбомов без журнала (старый формат) переносятся: готовые segment_NNN.flac считаются committed,
+    кроме последнего, если он не читается или короче MIN_SEGMENT_SECONDS (см. measure).
+    """
+
+    def __init__(self, seg_dir):
+        self.seg_dir = seg_dir
+        self.path = os.path.join(seg_dir, JOURNAL_NAME)
+        self.segments = []
+        if os.path.exists(self.path):
+            self._load()
+        else:
+            self._migrate()
+
+    def __len__(self):
+        return len(self.segments)
+
+    def segment_path(self, idx):
+        return os.path.join(self.seg_dir, f"segment_{idx:03d}.flac")
+
+    def claim(self, idx, item, bpm, key):
+        """Новый сегмент idx под текст item (SpoolItem)."""
+        if idx != len(self.segments): raise ValueError(f"Сегмент {idx} не следующий по порядку ({len(self.segments)})")
+        self.segments.append({
+            "idx": idx, "state": "claimed", "text": item._asdict(), "bpm": bpm, "key": key, "claimed_at": time.time()
+        })
+        self._write()
+
+    def mark(self, idx, state, **fields):
+        if state not in STATES: raise ValueError(f"Неизвестное состояние сегмента: {state}")
+        seg = self.segments[idx]
+        seg.update(fields)
+        seg["state"] = state
+        seg[f"{state}_at"] = time.time()
+        self._write()
+
+    def pending(self):
+        """Незакоммиченные сегменты по порядку."""
+        return [seg for seg in self.segments if seg["state"] != "committed"]
+
+    def text_ids(self):
+        """ID текстов спула, которые держат незакоммиченные сегменты."""
+        return [seg["text"]["id"] for seg in self.pending() if seg.get("text")]
+
+    def reusable(self, seg):
+        """Путь к результату генерации, если он на месте и не испорчен, иначе None."""
+        path = seg.get("gen_path")
+        if not path or not os.path.exists(path): return None
+        if seg.get("gen_hash") and file_hash(path) != seg["gen_hash"]:
+            print(f"⚠️ Результат генерации сегмента {seg['idx'] + 1} поврежден, генерирую заново")
+            return None
+        return path
+
+    def measure(self):
+        """
+        Дописывает измеренную длину сегментам, у которых ее нет (перенесенные по файлам).
+        Раньше сегменты писались сразу под своим именем, и последний мог остаться недописанным при остановке:
+        если он не читается или короче MIN_SEGMENT_SECONDS, он убирается из журнала и генерируется заново.
+        Зовется из потока: ffprobe идет через media_jobs.
+        """
+        changed = False
+        for seg in self.segments:
+            if seg["state"] in ("processed", "committed") and seg.get("duration") is None:
+                try:
+                    sr, samples = au.get_audio_info(self.segment_path(seg["idx"]))
+                    seg["duration"] = samples / sr
+                    changed = True
+                except Exception as e:
+                    logger.warning(f"Не удалось измерить сегмент {seg['idx'] + 1}: {e}")
+        last = self.segments[-1] if self.segments else None
+        if last and last.get("migrated") and (last.get("duration") or 0) < MIN_SEGMENT_SECONDS:
+            print(f"⚠️ Сегмент {last['idx'] + 1} недописан ({last.get('duration') or 0:.1f} сек), генерирую заново")
+            path = self.segment_path(last["idx"])
+            if os.path.exists(path): os.remove(path)
+            self.segments.pop()
+            changed = True
+        if changed: self._write()
+
+    def duration(self):
+        """Длина альбома из уже записанных сегментов: измеренные длины, для остальных — TRACK_DURATION."""
+        if not self.segments: return 0
+        total = sum(seg.get("duration") or TRACK_DURATION for seg in self.segments)
+        return total - (len(self.segments) - 1) * CROSSFADE_DURATION
+
+    # --- Внутренности ---
+
+    def _write(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"segments": self.segments}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.segments = json.load(f)["segments"]
+        except Exception as e:
+            # Журнал пишется через rename, битым он бывает только при порче диска
+            print(f"⚠️ Журнал сегментов {self.path} поврежден ({e}), восстанавливаю по файлам")
+            self._migrate()
+
+    def _migrate(self):
+        # Раньше сегменты писались сразу под своим именем: берем только непрерывный ряд segment_000, 001, ...
+        self.segments = []
+        while os.path.exists(self.segment_path(len(self.segments))):
+            self.segments.append({
+                "idx": len(self.segments), "state": "committed", "text": None, "duration": None, "migrated": True
+            })
+        if os.path.isdir(self.seg_dir): self._write()
+        if self.segments:
+            print(f"📦 Журнал сегментов создан по файлам: {len(self.segments)} готовых сегментов")
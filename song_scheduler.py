@@ -0,0 +1,164 @@
+import os
+import json
+import random
+import logging
+from array import array
+from collections import deque
+from config import *
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("shuffle", "artist", "order")
+
+def artist_of(song_id):
+    # "shadowraze - Track_1867" -> "shadowraze"
+    return song_id.split(" - ", 1)[0].strip() if " - " in song_id else ""
+
+class SongScheduler:
+    """
+    Выбор песни-образца для воркеров текстов без линейного прохода по базе.
+    Позиции индекса раскладываются в перестановку по seed блоками: при дочитке базы новые песни
+    добавляются новым блоком, уже пройденный порядок не меняется. Перестановка восстанавливается
+    из seed и границ блоков, поэтому на диске только курсоры (song_scheduler.json).
+    Политики: shuffle — одна дорожка; artist — дорожка на каждого исполнителя (префикс ID до " - "),
+    дорожки по кругу; order — порядок файла, как раньше.
+    reserve() -> песня в работе, commit() — текст готов, release() — LLM не справилась, песня вернется первой.
+    """
+
+    def __init__(self, index, history, path=SCHEDULER_STATE_FILE, policy=SCHEDULER_POLICY, seed=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Неизвестная политика планировщика: {policy} (есть: {', '.join(POLICIES)})")
+        self.index = index
+        self.history = history
+        self.path = path
+        self.policy = policy
+        self.seed = seed
+        self.blocks = []         # [start, end) позиций индекса
+        self.lanes = {}          # дорожка -> array позиций в порядке выдачи
+        self.cursors = {}        # дорожка -> сколько позиций пройдено
+        self.rotation = deque()  # дорожки, где еще есть песни, в порядке очереди
+        self.returned = deque()  # отпущенные песни, выдаются первыми
+        self.reserved = set()
+        self.rebuilds = None
+        self._load()
+
+    # --- Публичное API ---
+
+    def sync(self):
+        """Подхватывает рост базы новым блоком; если индекс перестроен — начинает перестановку заново."""
+        if self.rebuilds is not None and self.rebuilds != self.index.rebuilds:
+            self._reset("база текстов перестроена")
+        self.rebuilds = self.index.rebuilds
+        covered = self.blocks[-1][1] if self.blocks else 0
+        if len(self.index) > covered:
+            self._add_block(covered, len(self.index))
+            self._save()
+        return self
+
+    def reserve(self):
+        """Следующая неспетая песня: (позиция, id) или None, если база пройдена."""
+        self.sync()
+        while self.returned:
+            song_id = self.returned.popleft()
+            pos = self.index.by_id.get(song_id)
+            if pos is not None and not self._taken(song_id):
+                return self._take(pos, song_id)
+
+        while self.rotation:
+            lane = self.rotation.popleft()
+            pos = self._next_in_lane(lane)
+            if pos is None: continue   # дорожка пройдена и выпадает из круга
+            if self.cursors[lane] < len(self.lanes[lane]): self.rotation.append(lane)
+            return self._take(pos, self.index.id_at(pos))
+        self._save()
+        return None
+
+    def commit(self, song_id):
+        self.reserved.discard(song_id)
+        self._save()
+
+    def release(self, song_id):
+        if song_id in self.reserved:
+            self.reserved.discard(song_id)
+            self.returned.appendleft(song_id)
+            self._save()
+
+    def remaining(self):
+        return sum(len(self.lanes[l]) - self.cursors.get(l, 0) for l in self.rotation) + len(self.returned)
+
+    # --- Внутренности ---
+
+    def _taken(self, song_id):
+        return song_id in self.history or song_id in self.reserved
+
+    def _take(self, pos, song_id):
+        self.reserved.add(song_id)
+        self._save()
+        return pos, song_id
+
+    def _next_in_lane(self, lane):
+        # Каждая позиция пропускается не больше одного раза за всю жизнь курсора — O(1) амортизированно
+        positions, cur = self.lanes[lane], self.cursors.get(lane, 0)
+        while cur < len(positions):
+            pos = positions[cur]
+            cur += 1
+            if pos < len(self.index) and not self._taken(self.index.id_at(pos)):
+                self.cursors[lane] = cur
+                return pos
+        self.cursors[lane] = cur
+        return None
+
+    def _add_block(self, start, end):
+        order = list(range(start, end))
+        if self.policy != "order":
+            random.Random(f"{self.seed}:{start}").shuffle(order)
+        self.blocks.append([start, end])
+        active = set(self.rotation)
+        for pos in order:
+            lane = artist_of(self.index.id_at(pos)) if self.policy == "artist" else ""
+            self.lanes.setdefault(lane, array("L")).append(pos)
+            if lane not in active:
+                # Новая дорожка или пройденная, в которую дочитались песни, — снова в круг
+                active.add(lane)
+                self.rotation.append(lane)
+
+    def _reset(self, reason):
+        logger.info(f"🔀 Планировщик песен начат заново: {reason}")
+        self.blocks, self.lanes, self.cursors, self.rotation = [], {}, {}, deque()
+
+    def _load(self):
+        state = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f: state = json.load(f)
+            except Exception as e:
+                print(f"⚠️ Состояние планировщика песен повреждено, начинаю заново: {e}")
+        if self.seed is None:
+            self.seed = state.get("seed", random.randrange(2 ** 32))
+        # Взятые до рестарта, но не подтвержденные песни снова в начале очереди
+        self.returned.extend(state.get("reserved", []) + state.get("returned", []))
+
+        blocks = state.get("blocks", [])
+        last = state.get("last_id")
+        if (state.get("seed") != self.seed or state.get("policy") != self.policy or not blocks
+                or blocks[-1][1] > len(self.index) or self.index.id_at(blocks[-1][1] - 1) != last):
+            # Другой seed/политика или база переписана — курсоры старой перестановки не годятся
+            return
+        for start, end in blocks: self._add_block(start, end)
+        self.cursors = state.get("cursors", {})
+        self.rotation = deque(l for l in state.get("rotation", []) if l in self.lanes)
+
+    def _save(self):
+        end = self.blocks[-1][1] if self.blocks else 0
+        state = {
+            "seed": self.seed, "policy": self.policy, "blocks": self.blocks,
+            "last_id": self.index.id_at(end - 1) if 0 < end <= len(self.index) else None,
+            "cursors": self.cursors, "rotation": list(self.rotation),
+            "reserved": sorted(self.reserved), "returned": list(self.returned),
+        }
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f: json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"⚠️ Не удалось сохранить состояние планировщика песен: {e}")
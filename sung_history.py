@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import logging
+from config import *
+
+logger = logging.getLogger(__name__)
+
+COMPACT_SLACK = 200   # сколько лишних строк (обновления, битые хвосты) терпим в журнале до компактации
+
+class SungHistory:
+    """
+    История спетых песен: журнал sung_songs.jsonl, куда только дописываются строки, и индекс в памяти.
+    Строка журнала — {"id", "ts", "album", "provider", "model"}; повторная строка с тем же id
+    дополняет запись (так к песне позже привязывается альбом). Проверка "уже пели?" — O(1) по dict.
+    Когда лишних строк набирается больше COMPACT_SLACK, журнал переписывается целиком через
+    временный файл и rename. Старый sung_songs.json при первом запуске переносится в журнал.
+    """
+
+    def __init__(self, path=SUNG_JOURNAL_FILE, legacy_path=SUNG_HISTORY_FILE):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.entries = {}   # id -> метаданные, в порядке добавления
+        self.lines = 0      # строк в журнале на диске
+        if os.path.exists(path):
+            self._load()
+        elif legacy_path and os.path.exists(legacy_path):
+            self._migrate()
+
+    def __contains__(self, song_id):
+        return song_id in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def ids(self):
+        return list(self.entries)
+
+    def get(self, song_id):
+        return self.entries.get(song_id)
+
+    def add(self, song_id, album=None, provider=None, model=None):
+        """Отмечает песню спетой. False, если она уже была в истории."""
+        if song_id in self.entries: return False
+        entry = {"id": song_id, "ts": round(time.time(), 3), "album": album, "provider": provider, "model": model}
+        self.entries[song_id] = entry
+        self._append(entry)
+        return True
+
+    def update(self, song_id, **meta):
+        """Дописывает метаданные к уже спетой песне (например, album после сборки сегмента)."""
+        entry = self.entries.get(song_id)
+        if entry is None:
+            return self.add(song_id, **meta)
+        meta = {k: v for k, v in meta.items() if v is not None and entry.get(k) != v}
+        if not meta: return False
+        entry.update(meta)
+        self._append({"id": song_id, **meta})
+        return True
+
+    def compact(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.lines = len(self.entries)
+
+    # --- Внутренности ---
+
+    def _append(self, record):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.lines += 1
+        if self.lines - len(self.entries) > COMPACT_SLACK:
+            self.compact()
+
+    def _load(self):
+        broken, last = 0, ""
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                last = line
+                if not line.strip(): continue
+                self.lines += 1
+                try:
+                    record = json.loads(line)
+                    song_id = record.pop("id")
+                except (ValueError, KeyError, AttributeError):
+                    # Недописанная при падении строка — теряем только ее
+                    broken += 1
+                    continue
+                entry = self.entries.setdefault(song_id, {"id": song_id, "ts": None, "album": None, "provider": None, "model": None})
+                entry.update({k: v for k, v in record.items() if v is not None})
+        if broken:
+            print(f"⚠️ В истории спетых песен пропущено битых строк: {broken}")
+        if broken or (last and not last.endswith("\n")):
+            # Переписываем журнал, чтобы следующая строка не приклеилась к оборванной
+            self.compact()
+
+    def _migrate(self):
+        try:
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"⚠️ Ошибка чтения истории спетых песен: {e}")
+            return
+        for song_id in data if isinstance(data, list) else []:
+            self.entries.setdefault(song_id, {"id": song_id, "ts": None, "album": None, "provider": None, "model": None})
+        self.compact()
+        print(f"📦 История спетых песен перенесена в {self.path}: {len(self.entries)} песен")
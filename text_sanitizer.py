@@ -0,0 +1,103 @@
+import os
+import re
+import logging
+from config import *
+
+logger = logging.getLogger(__name__)
+
+# Очистка ответов LLM и поиск отказов. Все регэкспы компилируются один раз при импорте,
+# матчер отказов строится один раз на версию denials.txt (кэш — live_config.get_denials).
+
+RE_THINK = re.compile(r"<think>.*?</think>", flags=re.DOTALL | re.IGNORECASE)
+# Ищем саму метку, а не "(?s).*?метка": на длинном ответе без метки ленивый префикс
+# перебирал бы все стартовые позиции, то есть работал бы квадратично
+RE_END_OF_THOUGHT = re.compile(r"End of Thought\s*\(\*?\d+(?:\.\d+)?s?\)\s*", flags=re.IGNORECASE)
+RE_NOTE = re.compile(r"\n?\s*(?:---|\*\*\*|___)?\s*(?:Примечание|Note|P\.S\.)[:\s].*$", flags=re.DOTALL | re.IGNORECASE)
+RE_CODE_BLOCK = re.compile(r"```[a-zA-Z]*\n?(.*?)\n?```", flags=re.DOTALL)
+RE_BOLD = re.compile(r"\*\*(.*?)\*\*")
+
+PREFIXES = [
+    "Prompt:", "Lyrics:", "Response:", "Here is", "Sure,", "I will",
+    "Название:", "Название песни:", "Title:", "Текст песни:", "Отредактированный текст:"
+]
+# Ни один префикс не начинается с другого, поэтому в каждой точке совпадает максимум один
+RE_PREFIX = re.compile("|".join(re.escape(p) for p in sorted(PREFIXES, key=len, reverse=True)), flags=re.IGNORECASE)
+
+DEFAULT_DENIALS = ["as an ai", "i cannot", "unauthorized", "explicit", "offensive", "policy"]
+
+def super_clean(text):
+    if not text: return ""
+
+    # 1. Удаляем <think> блоки
+    text = RE_THINK.sub("", text)
+
+    # 2. Удаляем ВЕСЬ блок рассуждений в начале — до последней метки End of Thought
+    last = None
+    for last in RE_END_OF_THOUGHT.finditer(text): pass
+    if last: text = text[last.end():]
+
+    # 3. Удаляем "Примечание", "Note" и всё, что после них до конца текста
+    text = RE_NOTE.sub("", text)
+
+    # 4. Чистим Markdown блоки кода ```...```
+    text = RE_CODE_BLOCK.sub(r"\1", text)
+
+    # 5. Удаляем жирное выделение **...**
+    text = RE_BOLD.sub(r"\1", text)
+
+    # 6. Базовая очистка краев
+    text = text.strip().strip('"').strip('«').strip('»').strip("'")
+
+    # 7. Мусорные префиксы в начале: одна альтернация вместо перебора списка с lower() на каждый префикс
+    while True:
+        m = RE_PREFIX.match(text)
+        if not m: break
+        text = text[m.end():].strip().strip(":").strip()
+
+    return text
+
+def parse_denials(lines):
+    """Встроенные фразы плюс строки denials.txt (в нижнем регистре, без пустых и # комментариев)."""
+    phrases = set(DEFAULT_DENIALS)
+    for line in lines:
+        p = line.strip().lower()
+        if p and not p.startswith("#"): phrases.add(p)
+    return phrases
+
+def read_denials(path=DENIALS_FILE):
+    if not os.path.exists(path): return parse_denials([])
+    with open(path, "r", encoding="utf-8") as f: return parse_denials(f)
+
+def _trie_pattern(phrases):
+    """Фразы -> регэксп-бор: общие префиксы проверяются один раз, на каждой позиции текста — один проход по дереву."""
+    trie = {}
+    for p in phrases:
+        node = trie
+        for ch in p: node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches: return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+class DenialMatcher:
+    """
+    Автомат по всем фразам отказа сразу: бор из фраз, скомпилированный в один регэксп.
+    search() возвращает сработавшее правило (саму фразу) — для логов, или None.
+    """
+
+    def __init__(self, phrases):
+        self.phrases = frozenset(p for p in phrases if p)
+        self.regex = re.compile(_trie_pattern(self.phrases)) if self.phrases else None
+
+    def search(self, text):
+        if not self.regex or not text: return None
+        m = self.regex.search(text.lower())
+        return m.group(0) if m else None
+
+    def __contains__(self, text):
+        return self.search(text) is not None
@@ -0,0 +1,100 @@
+import time
+import sqlite3
+import asyncio
+import logging
+import metrics
+from collections import namedtuple
+from config import *
+
+logger = logging.getLogger(__name__)
+
+SpoolItem = namedtuple("SpoolItem", ["id", "caption", "lyrics", "song_id"])
+
+class TextSpool:
+    """
+    Очередь готовых пар caption/lyrics на диске (SQLite в режиме WAL), переживает рестарт.
+    Семантика: put -> get (claim) -> ack после сохранения сегмента. Отдельного requeue нет: взятые,
+    но не подтвержденные записи возвращаются в очередь только при старте (__init__), а те, что держит
+    журнал сегментов незавершенного альбома, сразу забираются обратно через reclaim.
+    Размер ограничен maxsize: put ждет, пока в очереди не освободится место.
+    """
+
+    def __init__(self, path=TEXT_SPOOL_FILE, maxsize=TEXT_QUEUE_SIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS texts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                caption TEXT NOT NULL,
+                lyrics TEXT NOT NULL,
+                song_id TEXT,
+                state TEXT NOT NULL DEFAULT 'ready',
+                created REAL NOT NULL,
+                claimed_at REAL
+            )
+        """)
+        self.cond = asyncio.Condition()
+        recovered = self.db.execute("UPDATE texts SET state = 'ready', claimed_at = NULL WHERE state = 'claimed'").rowcount
+        if recovered:
+            print(f"♻️ Вернул в очередь {recovered} текстов, взятых до рестарта.")
+        self._publish()
+
+    def qsize(self):
+        return self.db.execute("SELECT COUNT(*) FROM texts WHERE state = 'ready'").fetchone()[0]
+
+    def empty(self):
+        return self.qsize() == 0
+
+    async def put(self, caption, lyrics, song_id=None):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.qsize() < self.maxsize)
+            self.db.execute(
+                "INSERT INTO texts (caption, lyrics, song_id, created) VALUES (?, ?, ?, ?)",
+                (caption, lyrics, song_id, time.time())
+            )
+            self._publish()
+            self.cond.notify_all()
+
+    async def get(self):
+        """Забирает самую старую готовую запись (claim). Ждет, если очередь пуста."""
+        async with self.cond:
+            waited_since = None
+            while True:
+                row = self._claim()
+                if row: break
+                if waited_since is None: waited_since = time.monotonic()
+                await self.cond.wait()
+            if waited_since is not None:
+                # Спул был пуст: все это время генерация простаивала без текстов
+                metrics.TEXT_QUEUE_STARVED.inc(time.monotonic() - waited_since)
+            self._publish()
+            self.cond.notify_all()
+            return SpoolItem(*row)
+
+    async def ack(self, item_id):
+        async with self.cond:
+            self.db.execute("DELETE FROM texts WHERE id = ?", (item_id,))
+            self.cond.notify_all()
+
+    def reclaim(self, item_ids):
+        """После рестарта снова забирает тексты, которые держат незавершенные сегменты (их журнал хранит копию)."""
+        for item_id in item_ids:
+            self.db.execute("UPDATE texts SET state = 'claimed', claimed_at = ? WHERE id = ?", (time.time(), item_id))
+        self._publish()
+
+    def close(self):
+        self.db.close()
+
+    def _publish(self):
+        metrics.TEXT_QUEUE_DEPTH.set(self.qsize())
+
+    def _claim(self):
+        row = self.db.execute(
+            "SELECT id, caption, lyrics, song_id FROM texts WHERE state = 'ready' ORDER BY id LIMIT 1"
+        ).fetchone()
+        if row:
+            self.db.execute("UPDATE texts SET state = 'claimed', claimed_at = ? WHERE id = ?", (time.time(), row[0]))
+        return row
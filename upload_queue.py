@@ -0,0 +1,154 @@
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+from config import *
+
+logger = logging.getLogger(__name__)
+
+RETRY_MAX_DELAY = 60 * 60
+
+class UploadQueue:
+    """
+    Очередь отправки готовых альбомов (SQLite в режиме WAL), переживает рестарт.
+    sink — корутина sink(path, album_id), например tg.send_to_telegram; исключение или False — неудача.
+    Отправляют UPLOAD_CONCURRENCY воркеров; неудачная отправка повторяется с экспоненциальной
+    паузой UPLOAD_RETRY_BASE * 2^n, после UPLOAD_MAX_ATTEMPTS попыток альбом помечается failed.
+    Один альбом в очередь попадает один раз, даже если после рестарта его отрендерили заново.
+    Прерванные рестартом отправки начинаются сначала. drain() при остановке ждет, пока очередь опустеет.
+    """
+
+    def __init__(self, sink, path=UPLOAD_QUEUE_FILE, concurrency=UPLOAD_CONCURRENCY,
+                 max_attempts=UPLOAD_MAX_ATTEMPTS, retry_base=UPLOAD_RETRY_BASE):
+        self.sink = sink
+        self.path = path
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.workers = []
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS uploads (
+                album_id TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_at REAL NOT NULL DEFAULT 0,
+                error TEXT,
+                created REAL NOT NULL,
+                done_at REAL
+            )
+        """)
+        self.cond = asyncio.Condition()
+        recovered = self.db.execute("UPDATE uploads SET state = 'pending', next_at = 0 WHERE state = 'uploading'").rowcount
+        if recovered:
+            print(f"♻️ Вернул в очередь {recovered} отправок, прерванных рестартом.")
+        left = self.outstanding()
+        if left:
+            print(f"📤 В очереди отправки с прошлого запуска: {left}")
+
+    def outstanding(self):
+        return self.db.execute("SELECT COUNT(*) FROM uploads WHERE state IN ('pending', 'uploading')").fetchone()[0]
+
+    def due(self):
+        """Отправки, которые идут или могут пойти прямо сейчас (без тех, что ждут паузы перед повтором)."""
+        return self.db.execute(
+            "SELECT COUNT(*) FROM uploads WHERE state = 'uploading' OR (state = 'pending' AND next_at <= ?)", (time.time(),)
+        ).fetchone()[0]
+
+    def start(self):
+        self.workers = [asyncio.create_task(self._worker(i + 1)) for i in range(self.concurrency)]
+
+    async def put(self, path, album_id):
+        async with self.cond:
+            added = self.db.execute(
+                "INSERT OR IGNORE INTO uploads (album_id, path, created) VALUES (?, ?, ?)",
+                (album_id, path, time.time())
+            ).rowcount
+            if not added:
+                print(f"📤 Альбом {album_id} уже в очереди отправки (или отправлен), пропускаю")
+            self.cond.notify_all()
+
+    async def drain(self, timeout=UPLOAD_DRAIN_TIMEOUT):
+        """
+        Ждет отправок, которые идут или готовы пойти, но не дольше timeout, затем останавливает воркеров.
+        Отправки на паузе перед повтором (до RETRY_MAX_DELAY) не ждем — они уйдут после рестарта.
+        """
+        left = self.due()
+        if left:
+            print(f"⏳ Дожидаюсь отправки альбомов: {left}...")
+        try:
+            async with self.cond:
+                await asyncio.wait_for(self.cond.wait_for(lambda: self.due() == 0), timeout)
+        except asyncio.TimeoutError:
+            print(f"⏰ Не все альбомы отправлены за {timeout} сек, остаток уйдет после рестарта: {self.outstanding()}")
+        else:
+            if self.outstanding():
+                print(f"📤 Ждут повтора отправки, уйдут после рестарта: {self.outstanding()}")
+        for w in self.workers: w.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def close(self):
+        self.db.close()
+
+    # --- Внутренности ---
+
+    async def _worker(self, worker_id):
+        while True:
+            async with self.cond:
+                while True:
+                    job, wait = self._claim()
+                    if job: break
+                    # Пусто или все ждут паузы перед повтором — спим до ближайшего next_at или до put()
+                    try:
+                        await asyncio.wait_for(self.cond.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+            album_id, path, attempts = job
+            await self._upload(worker_id, album_id, path, attempts)
+
+    async def _upload(self, worker_id, album_id, path, attempts):
+        attempt = attempts + 1
+        error = None
+        if not os.path.exists(path):
+            error, attempt = "файл не найден", self.max_attempts
+        else:
+            print(f"📤 [upload #{worker_id}] Отправка альбома {album_id} (попытка {attempt}/{self.max_attempts})...")
+            try:
+                if await self.sink(path, album_id) is False: error = "отправка не удалась"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = str(e) or type(e).__name__
+
+        async with self.cond:
+            if error is None:
+                self.db.execute("UPDATE uploads SET state = 'done', attempts = ?, error = NULL, done_at = ? WHERE album_id = ?",
+                                (attempt, time.time(), album_id))
+                print(f"✅ Альбом {album_id} отправлен.")
+            elif attempt >= self.max_attempts:
+                self.db.execute("UPDATE uploads SET state = 'failed', attempts = ?, error = ? WHERE album_id = ?",
+                                (attempt, error, album_id))
+                print(f"❌ Альбом {album_id} так и не отправлен ({error}). Файл: {path}")
+            else:
+                delay = min(self.retry_base * 2 ** (attempt - 1), RETRY_MAX_DELAY)
+                self.db.execute("UPDATE uploads SET state = 'pending', attempts = ?, error = ?, next_at = ? WHERE album_id = ?",
+                                (attempt, error, time.time() + delay, album_id))
+                print(f"⚠️ Отправка альбома {album_id} не удалась ({error}), повтор через {int(delay)} сек.")
+            self.cond.notify_all()
+
+    def _claim(self):
+        """(job, None) или (None, сколько ждать до ближайшего повтора; None — ждать put())."""
+        now = time.time()
+        row = self.db.execute(
+            "SELECT album_id, path, attempts FROM uploads WHERE state = 'pending' AND next_at <= ? ORDER BY created LIMIT 1", (now,)
+        ).fetchone()
+        if row:
+            self.db.execute("UPDATE uploads SET state = 'uploading' WHERE album_id = ?", (row[0],))
+            return row, None
+        nxt = self.db.execute("SELECT MIN(next_at) FROM uploads WHERE state = 'pending'").fetchone()[0]
+        return None, (max(0.0, nxt - now) if nxt is not None else None)